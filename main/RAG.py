@@ -1,18 +1,62 @@
-import tempfile,uuid,os
-from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_huggingface.embeddings import HuggingFaceEndpointEmbeddings
-from typing import Dict, Tuple,Literal
-
-EMBEDDING_MODEL = HuggingFaceEndpointEmbeddings(model="sentence-transformers/all-MiniLM-L6-v2")
-
-BASE_DIR =  Path.cwd()
-
-RetrieverCacheKey = Tuple[uuid.UUID, uuid.UUID,Literal["YTvideo", "pdf"]]
-
-_RETRIEVER_CACHE: Dict[RetrieverCacheKey, any] = {}
+import io,uuid,os,time,hashlib,threading
+from langchain_core.documents import Document
+from typing import Iterable,Iterator,List,Tuple,Literal,TYPE_CHECKING
+from cache import LRUCache
+from embedding_cache import CachedEmbeddings
+from embedding_backends import create_embeddings,cache_name
+from database_utils import get_index_hash,delete_unreferenced_indexes
+from vector_backend import get_vector_backend
+from metrics import RETRIEVER_SECONDS,INDEX_BUILD_SECONDS
+
+# FAISS, langchain_community, the HF client and pypdf are imported on first use, keeping process start and imports cheap
+if TYPE_CHECKING:
+    from ingestion import ProgressCallback
+
+_EMBEDDING_MODEL: CachedEmbeddings | None = None
+_EMBEDDING_LOCK = threading.Lock()
+
+# Every chunk and query embedding goes through the shared content addressed cache before reaching the backend
+# chosen by EMBEDDING_BACKEND (remote endpoint, local sentence-transformers or an offline stub)
+def get_embedding_model() -> CachedEmbeddings:
+    global _EMBEDDING_MODEL
+    with _EMBEDDING_LOCK:
+        if _EMBEDDING_MODEL is None:
+            embeddings = create_embeddings()
+            _EMBEDDING_MODEL = CachedEmbeddings(embeddings, model_name=cache_name(embeddings))
+        return _EMBEDDING_MODEL
+
+# Retrievers are cached per index, not per thread, so threads sharing the same content share one copy in memory
+RetrieverCacheKey = Tuple[Literal["YTvideo", "pdf"], str]
+
+def _estimate_retriever_bytes(retriever) -> int:
+    # Index codes (or nothing when memory mapped) plus the raw text held in the docstore
+    vector_store = retriever.vectorstore
+    if not hasattr(vector_store, "index"):
+        return 0 # pgvector stores keep nothing in memory
+    from faiss_index import index_memory_bytes
+    docstore_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in vector_store.docstore._dict.values())
+    return index_memory_bytes(vector_store) + docstore_bytes
+
+def _optional_float(name:str):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+# Bounded so long running replicas do not keep every index ever opened in memory
+_RETRIEVER_CACHE = LRUCache(
+    max_entries=int(os.getenv("RETRIEVER_CACHE_MAX_ENTRIES", "64")),
+    max_bytes=int(float(os.getenv("RETRIEVER_CACHE_MAX_MB", "512")) * 1024 * 1024),
+    default_ttl=_optional_float("RETRIEVER_CACHE_TTL_SECONDS"),
+    sizeof=_estimate_retriever_bytes
+)
+
+# thread -> content hash; the mapping is immutable once set so it is safe to cache
+_THREAD_INDEX_CACHE = LRUCache(max_entries=4096)
+
+def make_content_hash(data:bytes, doc_type: Literal["YTvideo", "pdf"]) -> str:
+    # doc_type is part of the hash because chunking differs per type, the embedding model because vectors of different
+    # models (or widths) cannot be searched together
+    model_name = get_embedding_model().model_name
+    return hashlib.sha256(doc_type.encode("utf-8") + b"\x00" + model_name.encode("utf-8") + b"\x00" + data).hexdigest()
 
 def get_chunk_size(doc_type: Literal["YTvideo", "pdf"]) -> dict:
     if doc_type == "YTvideo":
@@ -27,74 +71,152 @@ def get_chunk_size(doc_type: Literal["YTvideo", "pdf"]) -> dict:
         }
 
 
-def create_vector_store(docs,thread_id:uuid.UUID,user_id:uuid.UUID,doc_type: Literal["YTvideo", "pdf"]):
+def get_splitter(doc_type: Literal["YTvideo", "pdf"]):
+    from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
+    chunk = get_chunk_size(doc_type)
+    return RecursiveCharacterTextSplitter(
+        chunk_size = chunk['chunk_size'],
+        chunk_overlap = chunk['chunk_overlap'],
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+
+def _as_retriever(vector_store):
+    return vector_store.as_retriever(search_type='similarity',search_kwargs={"k":5})
+
+
+def _build_index(chunk_stream:Iterable[List[Document]],thread_id:uuid.UUID,user_id:uuid.UUID,doc_type: Literal["YTvideo", "pdf"],content_hash:str,on_progress:"ProgressCallback | None" = None,total:int | None = None):
+    start = time.perf_counter()
+    thread_key = (user_id, thread_id, doc_type)
+    key = (doc_type, content_hash)
+    from ingestion import EmbeddingPipeline
+    pipeline = EmbeddingPipeline(get_embedding_model(), on_progress=on_progress, total=total)
+    published = False
+    try:
+        for chunks in chunk_stream:
+            pipeline.add_documents(chunks)
+            # Publish the partial index as soon as it has vectors so questions can be answered while the rest is embedded
+            if not published and pipeline.vector_store is not None:
+                _THREAD_INDEX_CACHE.set(thread_key, content_hash)
+                _RETRIEVER_CACHE.set(key, _as_retriever(pipeline.vector_store))
+                published = True
+        vector_store = pipeline.finish()
+    except Exception:
+        if published:
+            _RETRIEVER_CACHE.pop(key)
+            _THREAD_INDEX_CACHE.pop(thread_key)
+        raise
+
+    # Persist with the configured backend; it also points the thread at the index
+    get_vector_backend().save(vector_store, thread_id, user_id, doc_type, content_hash)
+    _THREAD_INDEX_CACHE.set(thread_key, content_hash)
+    # Set again with the complete index so the cache accounts for its final size
+    _RETRIEVER_CACHE.set(key, _as_retriever(vector_store))
+    INDEX_BUILD_SECONDS.observe(time.perf_counter() - start, doc_type=doc_type)
+
+
+def create_vector_store(docs,thread_id:uuid.UUID,user_id:uuid.UUID,doc_type: Literal["YTvideo", "pdf"],content_hash:str | None = None,on_progress:"ProgressCallback | None" = None):
     try:
+        if content_hash is None:
+            content_hash = make_content_hash("\n".join(d.page_content for d in docs).encode("utf-8"), doc_type)
+
+        # Identical content was already indexed (possibly by another user), only point this thread at it
+        if attach_existing_index(thread_id, user_id, doc_type, content_hash):
+            return content_hash
+
         # Perform Chunking
-        chunk = get_chunk_size(doc_type)
-        recursuive_splitter = RecursiveCharacterTextSplitter(
-            chunk_size = chunk['chunk_size'],
-            chunk_overlap = chunk['chunk_overlap'],
-            separators=["\n\n", "\n", " ", ""]
-        )
-
-        chunks = recursuive_splitter.split_documents(docs)
-
-        # Create Embediings
-        vector_store = FAISS.from_documents(
-            documents=chunks,
-            embedding=EMBEDDING_MODEL
-        )
-
-        # Save inside current directory
-        path = BASE_DIR / "data" / "faiss_store" / doc_type / str(user_id) / str(thread_id)
-
-        # Create path if not exists
-        path.mkdir(parents=True, exist_ok=True)
-
-        vector_store.save_local(
-            folder_path=str(path),
-            index_name=str(thread_id)
-        )
+        chunks = get_splitter(doc_type).split_documents(docs)
+
+        # Create Embediings in concurrent batches, the index grows as batches complete
+        _build_index([chunks],thread_id,user_id,doc_type,content_hash,on_progress=on_progress,total=len(chunks))
+        return content_hash
     except Exception as e:
         raise RuntimeError(f"Could not create vector store; Error: {e}") from e
 
 
-def ingest_pdf(file_bytes,thread_id:uuid.UUID,user_id:uuid.UUID):
-    temp_path = None
+def index_chunks(chunk_stream:Iterable[List[Document]],thread_id:uuid.UUID,user_id:uuid.UUID,doc_type: Literal["YTvideo", "pdf"],content_hash:str,on_progress:"ProgressCallback | None" = None):
+    # For callers that chunk themselves (e.g. timestamp-aware transcripts); chunks are embedded as they arrive
     try:
-        # Creates a temp file with some path
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", prefix="rag") as temp_file:
-            temp_file.write(file_bytes)
-            temp_path = temp_file.name
+        if attach_existing_index(thread_id, user_id, doc_type, content_hash):
+            return content_hash
+        _build_index(chunk_stream,thread_id,user_id,doc_type,content_hash,on_progress=on_progress)
+        return content_hash
+    except Exception as e:
+        raise RuntimeError(f"Could not create vector store; Error: {e}") from e
+
+
+def iter_pdf_pages(file_bytes:bytes, source:str = "uploaded.pdf") -> Iterator[Document]:
+    # Read straight from the uploaded bytes; pypdf parses each page only when it is reached
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(file_bytes))
+    total_pages = len(reader.pages)
+    for page_number, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": source, "page": page_number, "total_pages": total_pages})
 
-            # Create Loader
-            pdf_loader = PyPDFLoader(temp_file.name) # Need path, therfore create temp path
-            docs = pdf_loader.load()
 
-            create_vector_store(docs,thread_id,user_id,doc_type="pdf")
+def ingest_pdf(file_bytes,thread_id:uuid.UUID,user_id:uuid.UUID,on_progress:"ProgressCallback | None" = None,file_name:str | None = None):
+    try:
+        # Same bytes uploaded before: reuse the index without parsing or embedding
+        content_hash = make_content_hash(file_bytes, "pdf")
+        if attach_existing_index(thread_id, user_id, "pdf", content_hash):
+            return
+
+        # Chunk and embed page by page, only a few pages are held in memory at any time
+        splitter = get_splitter("pdf")
+        chunk_stream = (splitter.split_documents([page]) for page in iter_pdf_pages(file_bytes, source=file_name or "uploaded.pdf"))
+        _build_index(chunk_stream,thread_id,user_id,"pdf",content_hash,on_progress=on_progress)
 
     except Exception as e:
         raise RuntimeError(f"Could not ingest pdf; Error: {e}") from e
-    
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
 
 
-def get_retriever(thread_id:uuid.UUID,user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"]):
-    key = (user_id, thread_id,doc_type)
+def attach_existing_index(thread_id:uuid.UUID,user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"], content_hash:str) -> bool:
+    if not get_vector_backend().attach_existing(thread_id, user_id, doc_type, content_hash):
+        return False
+    _THREAD_INDEX_CACHE.set((user_id, thread_id, doc_type), content_hash)
+    return True
+
+
+def _load_retriever(thread_id:uuid.UUID,user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"]):
+    # Returns the retriever and where it came from, for metrics
+    thread_key = (user_id, thread_id, doc_type)
+    content_hash = _THREAD_INDEX_CACHE.get(thread_key)
+    if content_hash is None:
+        content_hash = get_index_hash(thread_id, user_id, doc_type)
+        if content_hash is None:
+            return None, "none"
+        _THREAD_INDEX_CACHE.set(thread_key, content_hash)
+
+    key = (doc_type, content_hash)
 
     # Fast path: cache hit
-    if key in _RETRIEVER_CACHE:
-        return _RETRIEVER_CACHE[key]
+    retriever = _RETRIEVER_CACHE.get(key)
+    if retriever is not None:
+        return retriever, "cache"
     
-    # Slow path: load from disk
-    path  = BASE_DIR / "data" / "faiss_store" / doc_type / str(user_id) / str(thread_id)
-    if Path(path).exists():
-        vector_store = FAISS.load_local(str(path), EMBEDDING_MODEL, allow_dangerous_deserialization=True,index_name=str(thread_id))
-        retriever = vector_store.as_retriever(search_type='similarity',search_kwargs={"k":5})
-        _RETRIEVER_CACHE[key] = retriever
-        return retriever
-    return None
+    # Slow path: load from the vector backend
+    vector_store = get_vector_backend().load(content_hash, doc_type, get_embedding_model())
+    if vector_store is None:
+        return None, "missing"
+    retriever = _as_retriever(vector_store)
+    _RETRIEVER_CACHE.set(key, retriever)
+    return retriever, "backend"
 
-    
+def get_retriever(thread_id:uuid.UUID,user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"]):
+    start = time.perf_counter()
+    retriever, source = _load_retriever(thread_id, user_id, doc_type)
+    RETRIEVER_SECONDS.observe(time.perf_counter() - start, doc_type=doc_type, source=source)
+    return retriever
+
+def gc_vector_indexes() -> int:
+    # Remove indexes no thread references any more, from the registry, the backend and the retriever cache. Deleting a
+    # thread drops its references (trg_threads_delete_data); retention runs this afterwards
+    def remove(content_hash:str, doc_type:str):
+        _RETRIEVER_CACHE.pop((doc_type, content_hash))
+        get_vector_backend().delete(content_hash, doc_type)
+    return len(delete_unreferenced_indexes(remove))
+
+def get_retriever_cache_stats() -> dict:
+    return _RETRIEVER_CACHE.stats()
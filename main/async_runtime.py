@@ -0,0 +1,35 @@
+import asyncio,threading
+from typing import AsyncIterator, Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Streamlit scripts are synchronous and rerun on every interaction, while async resources (AsyncConnectionPool,
+# AsyncPostgresSaver) are bound to the loop that created them. One long lived loop per process owns all of them.
+_LOOP: asyncio.AbstractEventLoop | None = None
+_LOCK = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="async-runtime", daemon=True).start()
+        return _LOOP
+
+def run_async(coro:Awaitable[T]) -> T:
+    # Block the calling thread until the coroutine finishes on the shared loop
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+def iter_async(agen:AsyncIterator[T]) -> Iterator[T]:
+    # Expose an async generator (e.g. graph.astream) as a plain generator for st.write_stream
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(agen, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
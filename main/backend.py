@@ -1,32 +1,61 @@
-import requests,os,re,asyncio
+import os,re,asyncio,functools
 from langgraph.graph import StateGraph, START
-from langgraph.checkpoint.postgres import PostgresSaver
-from langchain_groq import ChatGroq
-from typing import Annotated,TypedDict
+from typing import Annotated,TypedDict,NamedTuple
 from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage,AIMessage,ToolMessage,HumanMessage
-from langchain_core.tools import tool
-from langchain_community.tools import DuckDuckGoSearchRun
+from langchain_core.tools import tool,StructuredTool
 from langgraph.prebuilt import tools_condition
-from RAG import get_retriever,create_vector_store
+from langgraph.constants import TAG_NOSTREAM
+from RAG import get_retriever
+from retrieval import search
+from context_packing import pack_documents
+from transcripts import index_video,TranscriptUnavailable
 from langchain_core.runnables import RunnableConfig
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled
-from langchain_core.documents import Document
-from database_utils import init_schema,pool
+from http_client import http_client,async_http_client
+from tool_cache import tool_cache
+from exchange_rates import rate_table
+from context_window import plan_context,summary_prompt,render_prompt
+from jobs import is_indexing
+from llm_scheduler import llm_scheduler,ScheduledModel
+from metrics import timed,NODE_SECONDS,TOOL_SECONDS,TOOL_CALLS
 
 # define the state
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     tool_call_count:int
+    summary:str # Rolling summary of the messages dropped from the prompt
+    summarized_count:int # Number of leading messages already folded into summary
 
 # define model
-model = ChatGroq(model="openai/gpt-oss-120b",temperature=0.5)
-rename_chat_model = ChatGroq(model="openai/gpt-oss-20b",temperature=0.1)
+class Models(NamedTuple):
+    model: object
+    rename_chat_model: object
+    tool_llm: object
+
+# Built on first use, once per process (see bootstrap); importing this module creates no clients
+@functools.cache
+def get_models() -> Models:
+    from langchain_groq import ChatGroq
+    # Every call is queued against the per-model Groq limits; the chat model can fall back to the smaller one under load
+    chat_model = ChatGroq(model="openai/gpt-oss-120b",temperature=0.5)
+    small_model = ChatGroq(model="openai/gpt-oss-20b",temperature=0.1)
+    model = ScheduledModel(llm_scheduler, "openai/gpt-oss-120b", chat_model, fallback_name="openai/gpt-oss-20b", fallback=small_model)
+    rename_chat_model = ScheduledModel(llm_scheduler, "openai/gpt-oss-20b", small_model)
+    return Models(model=model, rename_chat_model=rename_chat_model, tool_llm=model.bind_tools(tools))
 
 # **************************************************** Tools *********************************************************
 
 # Define tools 
-search_tool = DuckDuckGoSearchRun(description="Search the web. Input: a plain string query.")
+@functools.cache
+def _get_search_run():
+    from langchain_community.tools import DuckDuckGoSearchRun
+    return DuckDuckGoSearchRun()
+
+# Same name and input as DuckDuckGoSearchRun, which is only imported when the model first searches
+@tool("duckduckgo_search")
+def search_tool(query:str) -> str:
+    """Search the web. Input: a plain string query."""
+    return _get_search_run().invoke(query)
 
 @tool
 def calculator(first_number:float, second_number:float, operation:str) -> dict:
@@ -51,22 +80,42 @@ def calculator(first_number:float, second_number:float, operation:str) -> dict:
     except Exception as e:
         return {"error":str(e)}
 
-@tool
-def get_weather(latitude:float,longitude:float) -> float:
-    """Provide you the temperature in celsius for any given location using it;s latitude and longitude position """
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m"
-    response = requests.get(url) # Returns a JSON schema 
-    data = response.json()
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+def _weather_request(latitude:float,longitude:float):
+    return OPEN_METEO_URL, {"latitude": latitude, "longitude": longitude, "current": "temperature_2m"}
+
+def _weather(latitude:float,longitude:float) -> float:
+    url, params = _weather_request(latitude, longitude)
+    data = http_client.get_json(url, params=params, name="get_weather") # Returns a JSON schema 
     return (data['current']['temperature_2m'])
 
-@tool
-def get_conversion_rate(base_currency:str,target_currency:str) -> float: # return -> dict:if returning JSON
-    """Fetches latest conversion rate between a base currency and target currency"""
-    api = os.getenv('EXCHANGE_API_KEY')
-    url = f"https://v6.exchangerate-api.com/v6/{api}/pair/{base_currency}/{target_currency}"
-    response = requests.get(url) # Returns a JSON object
-    data  = response.json() # Converts the JSON into a python dictionary
-    return data["conversion_rate"]
+async def _aweather(latitude:float,longitude:float) -> float:
+    url, params = _weather_request(latitude, longitude)
+    data = await async_http_client.get_json(url, params=params, name="get_weather")
+    return (data['current']['temperature_2m'])
+
+# Pairs are computed from one cached snapshot, so repeated conversions cost no API quota
+def _conversion_rate(base_currency:str,target_currency:str) -> float: # return -> dict:if returning JSON
+    return rate_table.rate(base_currency, target_currency)
+
+async def _aconversion_rate(base_currency:str,target_currency:str) -> float:
+    return await rate_table.arate(base_currency, target_currency)
+
+# Sync and async implementations share the pooled clients; the async graph awaits the coroutine instead of using a worker thread
+get_weather = StructuredTool.from_function(
+    func=_weather,
+    coroutine=_aweather,
+    name="get_weather",
+    description="Provide you the temperature in celsius for any given location using it;s latitude and longitude position "
+)
+
+get_conversion_rate = StructuredTool.from_function(
+    func=_conversion_rate,
+    coroutine=_aconversion_rate,
+    name="get_conversion_rate",
+    description="Fetches latest conversion rate between a base currency and target currency"
+)
 
 
 # We cannot pass dynmic objects such as retriever in the parameter, we only send static objects such as str,float etc.
@@ -105,12 +154,19 @@ def get_contextPDF(query:str,config:RunnableConfig):
     thread_id = config["configurable"]["thread_id"]
     retriever = get_retriever(thread_id, user_id,doc_type="pdf")
     if not retriever:
+        if is_indexing(thread_id, user_id, doc_type="pdf"):
+            return {"status":"The uploaded PDF is still indexing. Ask the user to wait a moment and try again"}
         return  {"error":"Retriever not initialized. Please upload the PDF to continue"}
-    docs = retriever.invoke(query)
-    return {
+    # Overlapping chunks are merged and the context is trimmed to the retrieval token budget
+    docs, _ = pack_documents(search(thread_id, user_id, "pdf", query) or [])
+    result = {
         "context": "\n\n".join(d.page_content for d in docs),
         "metadata": [d.metadata for d in docs]
     }
+    # Partial index published while the rest of the document is still being embedded in this process
+    if is_indexing(thread_id, user_id, doc_type="pdf", local_only=True):
+        result["status"] = "The PDF is still indexing; this context only covers the pages processed so far"
+    return result
     
 def parseYoutubeURL(url:str)->str:
    data = re.findall(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*", url)
@@ -148,6 +204,9 @@ def get_contextYTvideo(query:str,url:str,config:RunnableConfig):
     from general knowledge or inference without first retrieving context
     using this tool. If no relevant document context is found, explicitly state that the
     answer cannot be determined from the uploaded document
+
+    Each context passage starts with its [start-end] timestamp in the video;
+    cite these timestamps when pointing the user to a part of the video.
     """
     user_id = config["configurable"]["user_id"]
     thread_id = config["configurable"]["thread_id"]
@@ -156,27 +215,21 @@ def get_contextYTvideo(query:str,url:str,config:RunnableConfig):
         video_id = parseYoutubeURL(url)
         if not video_id:
             return {"error": "Cannot fetch the video link"}
-        ytt_api = YouTubeTranscriptApi()
         try:
-            transcript_list = ytt_api.fetch(video_id, languages=["en"])
-            transcript = ""
-            for snippet in transcript_list:
-                transcript +=  " " + snippet.text
-            docs = [Document(page_content=transcript,metadata={"source": url,"platform": "Youtube"})] # Expects a list of document objects
-            create_vector_store(docs=docs,thread_id=thread_id,user_id=user_id,doc_type="YTvideo") 
-            retriever = get_retriever(thread_id, user_id,doc_type="YTvideo")
-        except TranscriptsDisabled:
+            # Transcript and index are shared per video; only the first thread asking about it fetches and embeds
+            retriever = index_video(video_id, url, thread_id, user_id)
+        except TranscriptUnavailable:
             return ("No captions available for the video")
         except Exception as e:
             return {"error":f"Failed to create video vector store; Error: {str(e)}"}
-    docs = retriever.invoke(query)
+    docs, _ = pack_documents(search(thread_id, user_id, "YTvideo", query) or [])
+    # Timestamps let the answer cite where in the video the context comes from
     return {
-        "context": "\n\n".join(d.page_content for d in docs),
+        "context": "\n\n".join(f"[{d.metadata['timestamp']}] {d.page_content}" if "timestamp" in d.metadata else d.page_content for d in docs),
         "metadata": [d.metadata for d in docs]
     }
     
 tools = [search_tool,calculator,get_conversion_rate,get_weather,get_contextPDF,get_contextYTvideo]
-tool_llm = model.bind_tools(tools)
 
 
 # ******************************************************** Graph Fucntions ********************************************
@@ -187,18 +240,60 @@ for tool in tools:
     tool_map[tool.name] = tool
 
 # define fucntion
+# Full history stays in the checkpoint, the model only sees the summary plus the turns that fit the token budget
+def _context_updates(state:ChatState, summary:str, summarized_count:int) -> dict:
+    if summarized_count == state.get("summarized_count", 0):
+        return {}
+    return {"summary": summary, "summarized_count": summarized_count}
+
+def prepare_context(state:ChatState):
+    messages = state['messages']
+    previous_count = state.get("summarized_count", 0)
+    summary = state.get("summary", "")
+    kept, summarized_count = plan_context(messages, previous_count)
+    if summarized_count > previous_count:
+        # Summariser output must not be streamed to the UI
+        summary = get_models().rename_chat_model.invoke(summary_prompt(summary, messages[previous_count:summarized_count]), config={"tags":[TAG_NOSTREAM]}).content
+    return render_prompt(kept, summary), _context_updates(state, summary, summarized_count)
+
+async def aprepare_context(state:ChatState):
+    messages = state['messages']
+    previous_count = state.get("summarized_count", 0)
+    summary = state.get("summary", "")
+    kept, summarized_count = plan_context(messages, previous_count)
+    if summarized_count > previous_count:
+        summary = (await get_models().rename_chat_model.ainvoke(summary_prompt(summary, messages[previous_count:summarized_count]), config={"tags":[TAG_NOSTREAM]})).content
+    return render_prompt(kept, summary), _context_updates(state, summary, summarized_count)
+
+@timed(NODE_SECONDS, node="chat")
 def chat(state:ChatState):
     messages = state['messages']
-    response = tool_llm.invoke(messages) # Invoke using tool node
+    prompt, updates = prepare_context(state)
+    response = get_models().tool_llm.invoke(prompt) # Invoke using tool node
     if isinstance(messages[-1], HumanMessage):
         return {
             'messages': [response],
-            'tool_call_count': 0
+            'tool_call_count': 0,
+            **updates
         }
     
-    return {'messages': [response]} # Return as list for later concatenation with existing message list.
+    return {'messages': [response], **updates} # Return as list for later concatenation with existing message list.
 
+@timed(NODE_SECONDS, node="chat")
+async def async_chat(state:ChatState):
+    messages = state['messages']
+    prompt, updates = await aprepare_context(state)
+    response = await get_models().tool_llm.ainvoke(prompt)
+    if isinstance(messages[-1], HumanMessage):
+        return {
+            'messages': [response],
+            'tool_call_count': 0,
+            **updates
+        }
+    
+    return {'messages': [response], **updates}
 
+@timed(NODE_SECONDS, node="tools")
 def tool(state:ChatState):
     last_message = state['messages'][-1]
     current_count = state.get("tool_call_count",0)
@@ -207,7 +302,13 @@ def tool(state:ChatState):
         response = []
         for tc in last_message.tool_calls:
             if current_count < MAX_TOOL_CALLS:
-                result = tool_map[tc["name"]].invoke(tc["args"])
+                try:
+                    with TOOL_SECONDS.time(tool=tc["name"]):
+                        result = tool_cache.invoke(tool_map[tc["name"]], tc["args"]) # Cached tools skip the upstream call on a hit
+                except Exception:
+                    TOOL_CALLS.inc(tool=tc["name"], status="error")
+                    raise
+                TOOL_CALLS.inc(tool=tc["name"], status="ok")
                 current_count += 1
             else:
                 result  = result = f"Tool call limit exceeded: Only {MAX_TOOL_CALLS} tool calls are allowed per query. You have already made {current_count} calls. Please provide a final answer with the information gathered so far."
@@ -215,8 +316,9 @@ def tool(state:ChatState):
             response.append(tool_message)
         return {'messages': response, 'tool_call_count':current_count}
     
-# Have to convert postgres, all other node(ainvoke) and stream(astream) to implement Async. One async all async
+# Async build: async_chat(ainvoke) + async_tool on AsyncPostgresSaver, streamed with astream. One async all async
 
+@timed(NODE_SECONDS, node="tools")
 async def async_tool(state:ChatState):
     last_message = state['messages'][-1]
     current_count = state.get("tool_call_count",0)
@@ -232,8 +334,11 @@ async def async_tool(state:ChatState):
     async def run_tool(tc):
         tool_name = tc["name"]
         try:
-            result = await tool_map[tool_name].ainvoke(tc['args']) # returns a coroutine that must be awaited before converting to string
+            with TOOL_SECONDS.time(tool=tool_name):
+                result = await tool_cache.ainvoke(tool_map[tool_name], tc['args']) # returns a coroutine that must be awaited before converting to string
+            TOOL_CALLS.inc(tool=tool_name, status="ok")
         except Exception as e:
+            TOOL_CALLS.inc(tool=tool_name, status="error")
             result = f"Tool execution error: {str(e)}"
         return tc, result
     
@@ -254,24 +359,16 @@ async def async_tool(state:ChatState):
         "tool_call_count": current_count + len(allowed_calls)
     }
 
-# Create Graph
-builder = StateGraph(ChatState)
-
-
-# Define nodes and edges
-builder.add_node("chat_node",chat)
-builder.add_node("tools",tool)
-
-builder.add_edge(START,"chat_node")
-builder.add_conditional_edges("chat_node",tools_condition)
-builder.add_edge("tools","chat_node") # Connect tool_node to process node again
-
-init_schema()
-
-# Create checkpointer using the whole pool
-checkpointer = PostgresSaver(pool) # Checkpointer either needs a pool or a long lived connection(bad for NeonDB)
+# Nodes for either build; bootstrap chooses one at startup. The async build runs tool calls of a turn concurrently, so a multi-tool turn costs its slowest tool
+def build_graph(async_mode:bool = False):
+    # Create Graph
+    builder = StateGraph(ChatState)
 
-checkpointer.setup()
+    # Define nodes and edges
+    builder.add_node("chat_node",async_chat if async_mode else chat)
+    builder.add_node("tools",async_tool if async_mode else tool)
 
-# Compile the graph
-graph = builder.compile(checkpointer=checkpointer)
\ No newline at end of file
+    builder.add_edge(START,"chat_node")
+    builder.add_conditional_edges("chat_node",tools_condition)
+    builder.add_edge("tools","chat_node") # Connect tool_node to process node again
+    return builder
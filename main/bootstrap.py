@@ -0,0 +1,107 @@
+import os,time,threading
+from dataclasses import dataclass
+from database_utils import init_schema,get_pool,get_async_pool
+from async_runtime import run_async
+from pool_manager import start_pool_manager
+from metrics import REGISTRY,instrument_checkpointer,start_metrics_server
+
+# Choose at startup; see backend.build_graph
+ASYNC_GRAPH = os.getenv("PHOENIX_ASYNC_GRAPH", "false").lower() == "true"
+
+
+# Process-wide resources. Streamlit re-executes the script on every interaction, but modules (and this object) live for
+# the whole process, so clients, schema checks and graph compilation happen once.
+@dataclass
+class App:
+    graph: object
+    checkpointer: object
+    rename_chat_model: object
+    async_mode: bool
+    startup_seconds: float
+
+
+_APP: App | None = None
+_LOCK = threading.Lock()
+
+
+async def _create_async_checkpointer():
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    # Pool and saver must be created on the loop that will run the graph, async_runtime owns that loop
+    return AsyncPostgresSaver(await get_async_pool())
+
+
+def _register_collectors():
+    # stats() of the process-wide caches, pools and clients, read on every scrape
+    from pool_manager import get_pool_stats
+    from http_client import get_http_stats
+    from llm_scheduler import get_llm_stats
+    from tool_cache import tool_cache
+    from exchange_rates import rate_table
+    from RAG import get_retriever_cache_stats,get_embedding_model
+    from retrieval import get_query_cache_stats
+    from context_packing import get_packing_stats
+    from faiss_index import get_index_build_stats
+    for name, collect in (("pool", get_pool_stats), ("http", get_http_stats), ("llm", get_llm_stats), ("tool_cache", tool_cache.stats),
+                          ("rate_table", rate_table.stats), ("retriever_cache", get_retriever_cache_stats), ("embedding_cache", lambda: get_embedding_model().stats()),
+                          ("query_cache", get_query_cache_stats), ("context_packing", get_packing_stats), ("index_builds", get_index_build_stats)):
+        REGISTRY.register_collector(name, collect)
+
+
+def _create_app() -> App:
+    start = time.perf_counter()
+    from backend import build_graph,get_models
+
+    # Wake the database and open min_size connections before the first user request, then keep them alive
+    start_pool_manager(get_pool())
+    init_schema()
+
+    if ASYNC_GRAPH:
+        checkpointer = run_async(_create_async_checkpointer())
+    else:
+        from langgraph.checkpoint.postgres import PostgresSaver
+        # Create checkpointer using the whole pool
+        checkpointer = PostgresSaver(get_pool()) # Checkpointer either needs a pool or a long lived connection(bad for NeonDB)
+    _setup_checkpointer(checkpointer)
+
+    # Time checkpoint reads and writes on the request path
+    instrument_checkpointer(checkpointer)
+
+    # Prometheus text endpoint on its own port; the registry is always recorded, exporting is opt in
+    _register_collectors()
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+
+    # Optional in-process checkpoint compaction; the CLI (python retention.py) does the same on demand
+    if os.getenv("RETENTION_INTERVAL_SECONDS"):
+        from retention import start_retention_task
+        start_retention_task(float(os.getenv("RETENTION_INTERVAL_SECONDS")))
+
+    # Compile the graph
+    graph = build_graph(ASYNC_GRAPH).compile(checkpointer=checkpointer)
+    return App(
+        graph=graph,
+        checkpointer=checkpointer,
+        rename_chat_model=get_models().rename_chat_model,
+        async_mode=ASYNC_GRAPH,
+        startup_seconds=time.perf_counter() - start
+    )
+
+
+def _setup_checkpointer(checkpointer):
+    if ASYNC_GRAPH:
+        run_async(checkpointer.setup())
+    else:
+        checkpointer.setup()
+
+
+def get_app() -> App:
+    global _APP
+    with _LOCK:
+        if _APP is None:
+            _APP = _create_app()
+        app = _APP
+    # A version read at most every SCHEMA_CHECK_SECONDS. When a database reset dropped the tables under this process,
+    # recreate ours and the checkpointer's instead of failing every request until a restart
+    if init_schema():
+        _setup_checkpointer(app.checkpointer)
+    return app
@@ -0,0 +1,111 @@
+import threading,time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Thread safe LRU cache bounded by number of entries and estimated bytes; Streamlit runs every session in its own script thread,
+# therefore every read and write goes through a single lock.
+class LRUCache:
+    def __init__(self, max_entries:int = 128, max_bytes:Optional[int] = None, default_ttl:Optional[float] = None, sizeof:Optional[Callable[[Any],int]] = None):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than zero")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries: "OrderedDict[Hashable, tuple[Any, int, Optional[float]]]" = OrderedDict() # key -> (value, size, expires_at)
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key:Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _is_expired(self, expires_at:Optional[float]) -> bool:
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def get(self, key:Hashable, default:Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, _, expires_at = entry
+            if self._is_expired(expires_at):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key) # Mark as most recently used
+            self.hits += 1
+            return value
+
+    def set(self, key:Hashable, value:Any, ttl:Optional[float] = None, size:Optional[int] = None):
+        size = self._sizeof(value) if size is None else size
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # An entry larger than the whole budget would evict everything and still not fit, do not cache it
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.evictions += 1
+                return
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        # Expired entries are dropped when read or once they reach the least recently used end (front of the
+        # OrderedDict), never by scanning the whole cache; then least recently used ones go until both caps hold
+        now = time.monotonic()
+        while self._entries:
+            key, (_, _, expires_at) = next(iter(self._entries.items()))
+            if expires_at is not None and expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+            elif len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(key)
+                self.evictions += 1
+            else:
+                break
+
+    def pop(self, key:Hashable, default:Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __contains__(self, key:Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry[2])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,103 @@
+import os,threading,logging
+from langchain_core.documents import Document
+from transcripts import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1200"))
+MIN_OVERLAP_CHARS = 16 # Shorter matches between chunk edges are more likely coincidence than splitter overlap
+MIN_TRIMMED_CHARS = 200 # A partial chunk shorter than this is dropped rather than cut
+
+_STATS = {"calls": 0, "tokens_in": 0, "tokens_out": 0, "chunks_in": 0, "chunks_out": 0}
+_STATS_LOCK = threading.Lock()
+
+def text_tokens(text:str) -> int:
+    # Same ~4 characters per token rule as context_window.estimate_tokens
+    return len(text) // 4
+
+def _same_passage(a:Document, b:Document) -> bool:
+    # Chunks only overlap when the splitter cut them from the same page or the same video
+    return all(a.metadata.get(key) == b.metadata.get(key) for key in ("source", "page", "video_id"))
+
+def _overlap(left:str, right:str) -> int:
+    # Longest suffix of left that is also a prefix of right
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _join(first:Document, second:Document, overlap:int) -> Document:
+    metadata = {**first.metadata}
+    if "start" in first.metadata and "start" in second.metadata:
+        start = min(first.metadata["start"], second.metadata["start"])
+        end = max(first.metadata["end"], second.metadata["end"])
+        metadata.update(start=start, end=end, timestamp=f"{format_timestamp(start)}-{format_timestamp(end)}")
+    return Document(page_content=first.page_content + second.page_content[overlap:], metadata=metadata)
+
+def _merge(a:Document, b:Document) -> Document | None:
+    """Merge two chunks of the same passage when one contains the other or they share an overlapping edge."""
+    if not _same_passage(a, b):
+        return None
+    if b.page_content in a.page_content:
+        return a
+    if a.page_content in b.page_content:
+        return Document(page_content=b.page_content, metadata={**a.metadata, **b.metadata})
+    if overlap := _overlap(a.page_content, b.page_content):
+        return _join(a, b, overlap)
+    if overlap := _overlap(b.page_content, a.page_content):
+        return _join(b, a, overlap)
+    return None
+
+def _trim(text:str, tokens:int) -> str:
+    # Cut at a word boundary and mark the cut so the model knows the passage continues
+    cut = text[:tokens * 4].rsplit(" ", 1)[0]
+    return cut + " ..."
+
+def pack_documents(docs:list[Document], budget:int = RETRIEVAL_TOKEN_BUDGET) -> tuple[list[Document], dict]:
+    """
+    Turn retrieved chunks (best match first) into the context sent to the model: chunks repeated through splitter
+    overlap are merged into one passage, and passages are kept in relevance order until the token budget is used.
+    Returns the packed documents and a report of the tokens saved.
+    """
+    packed: list[Document] = []
+    for doc in docs:
+        # The passage takes the rank of its best chunk; a merged passage can bridge two earlier ones, so rescan after each merge
+        current, position = doc, len(packed)
+        i = 0
+        while i < len(packed):
+            joined = _merge(packed[i], current)
+            if joined is None:
+                i += 1
+                continue
+            current = joined
+            position = min(position, i)
+            del packed[i]
+            i = 0
+        packed.insert(position, current)
+
+    result: list[Document] = []
+    used = 0
+    for doc in packed:
+        tokens = text_tokens(doc.page_content)
+        if used + tokens <= budget:
+            result.append(doc)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining * 4 >= MIN_TRIMMED_CHARS or not result:
+            result.append(Document(page_content=_trim(doc.page_content, remaining), metadata={**doc.metadata, "truncated": True}))
+        break
+
+    tokens_in = sum(text_tokens(d.page_content) for d in docs)
+    tokens_out = sum(text_tokens(d.page_content) for d in result)
+    report = {"chunks_in": len(docs), "chunks_out": len(result), "tokens_in": tokens_in, "tokens_out": tokens_out, "tokens_saved": tokens_in - tokens_out}
+    with _STATS_LOCK:
+        _STATS["calls"] += 1
+        for key in ("tokens_in", "tokens_out", "chunks_in", "chunks_out"):
+            _STATS[key] += report[key]
+    logger.info(f"Packed {len(docs)} chunks into {len(result)}; saved {report['tokens_saved']} of {tokens_in} tokens")
+    return result, report
+
+def get_packing_stats() -> dict:
+    with _STATS_LOCK:
+        return {**_STATS, "tokens_saved": _STATS["tokens_in"] - _STATS["tokens_out"]}
@@ -0,0 +1,69 @@
+import os
+from langchain_core.messages import BaseMessage,HumanMessage,AIMessage,ToolMessage,SystemMessage
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+TOOL_OUTPUT_STUB_CHARS = 300 # Older tool outputs longer than this are replaced by a stub
+SUMMARY_SOURCE_CHARS = 1500 # Per message cap on what is sent to the summariser
+
+def estimate_tokens(message:BaseMessage) -> int:
+    # ~4 characters per token is close enough for budgeting and avoids a tokenizer dependency
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = len(content) // 4 + 4 # per message overhead
+    for tc in getattr(message, "tool_calls", None) or []:
+        tokens += len(str(tc.get("args", ""))) // 4 + 8
+    return tokens
+
+def _stub_tool_output(message:ToolMessage) -> ToolMessage:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    if len(content) <= TOOL_OUTPUT_STUB_CHARS:
+        return message
+    return message.model_copy(update={"content": f"[Output of {message.name} from an earlier turn omitted ({len(content)} characters). Call the tool again if it is needed.]"})
+
+def plan_context(messages:list[BaseMessage], summarized_count:int = 0, budget:int = CONTEXT_TOKEN_BUDGET) -> tuple[list[BaseMessage], int]:
+    """
+    Pick the messages sent to the model. Tool outputs from earlier turns are stubbed, and whole turns are dropped
+    from the front until the prompt fits the budget; the latest turn is always kept intact.
+    Returns the kept messages and the new number of leading messages that belong in the summary.
+    """
+    live = messages[summarized_count:]
+    turn_starts = [i for i, m in enumerate(live) if isinstance(m, HumanMessage)]
+    last_turn = turn_starts[-1] if turn_starts else 0
+
+    prepared = [_stub_tool_output(m) if isinstance(m, ToolMessage) and i < last_turn else m for i, m in enumerate(live)]
+    tokens = [estimate_tokens(m) for m in prepared]
+
+    # Cut only at turn boundaries so an AIMessage with tool_calls is never separated from its ToolMessages
+    start = 0
+    total = sum(tokens)
+    for boundary in turn_starts:
+        if total <= budget or boundary >= last_turn:
+            break
+        if boundary > start:
+            total -= sum(tokens[start:boundary])
+            start = boundary
+    if total > budget and last_turn > start:
+        total -= sum(tokens[start:last_turn])
+        start = last_turn
+
+    return prepared[start:], summarized_count + start
+
+def summary_prompt(summary:str, dropped:list[BaseMessage]) -> str:
+    lines = []
+    for message in dropped:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {str(message.content)[:SUMMARY_SOURCE_CHARS]}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"Assistant: {str(message.content)[:SUMMARY_SOURCE_CHARS]}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"(tool {message.name} was used)")
+    return (
+        "You maintain a running summary of a conversation between a user and an assistant.\n"
+        f"Current summary:\n{summary or '(empty)'}\n\n"
+        "Extend it with the following older messages. Keep facts, numbers, names, user preferences and open questions; "
+        "stay under 200 words and return only the summary.\n\n" + "\n".join(lines)
+    )
+
+def render_prompt(kept:list[BaseMessage], summary:str) -> list[BaseMessage]:
+    if not summary:
+        return kept
+    return [SystemMessage(content=f"Summary of the earlier part of this conversation:\n{summary}")] + kept
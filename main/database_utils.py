@@ -1,69 +1,296 @@
-import os,uuid
+import os,time,uuid,json,threading
+from typing import Callable, Iterable
 from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
-
-
-pool = ConnectionPool(
-    conninfo=os.getenv("DB_URL"),
-    min_size=1,
-    max_size=10,
-    kwargs={
-        "autocommit": True,
-        "row_factory":dict_row,
-        "prepare_threshold":0
-    }
-)
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
+
+CONNECTION_KWARGS = {
+    "autocommit": True,
+    "row_factory":dict_row,
+    "prepare_threshold":0
+}
+
+# Created on first use so importing this module (or rerunning a Streamlit script) never opens connections
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                conninfo=os.getenv("DB_URL"),
+                min_size=int(os.getenv("POOL_MIN_SIZE", "1")),
+                max_size=int(os.getenv("POOL_MAX_SIZE", "10")),
+                kwargs=CONNECTION_KWARGS
+            )
+        return _pool
+
 def get_conn():
-    return pool.connection()
-    
+    return get_pool().connection()
+
+_async_pool: AsyncConnectionPool | None = None
 
-def init_schema():
+# Used by the async graph build; must be called from the event loop that will use it (see async_runtime)
+async def get_async_pool() -> AsyncConnectionPool:
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(
+            conninfo=os.getenv("DB_URL"),
+            min_size=int(os.getenv("POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("POOL_MAX_SIZE", "10")),
+            open=False,
+            kwargs=CONNECTION_KWARGS
+        )
+        await _async_pool.open()
+    return _async_pool
+
+
+# Ordered schema migrations (version, name, statements). Applied versions are recorded in schema_migrations, so each
+# statement runs once per database; append new versions, never edit applied ones.
+MIGRATIONS = [
+    (1, "baseline", [
+        # Users Table
+        """
+            CREATE TABLE IF NOT EXISTS users (
+                id UUID PRIMARY KEY,
+                email TEXT NOT NULL UNIQUE CHECK (email ~* '^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\\.[A-Za-z]{2,}$'),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """,
+
+        # Initialize Local User
+        """
+            INSERT INTO users (id,email)
+            VALUES (
+                '00000000-0000-0000-0000-000000000001',
+                'bot@phoenix.app'
+            )
+            ON CONFLICT (id) DO NOTHING;
+        """,
+        # Thread table
+        """
+            CREATE TABLE IF NOT EXISTS threads (
+                    thread_id UUID PRIMARY KEY,
+                    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    thread_name TEXT NOT NULL,
+                    file_name TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+        """,
+        # Threads User index
+        """
+            CREATE INDEX IF NOT EXISTS idx_threads_user_id ON threads(user_id);
+        """,
+        # Keyset pagination of the sidebar on (created_at, thread_id)
+        """
+            CREATE INDEX IF NOT EXISTS idx_threads_user_created ON threads(user_id, created_at DESC, thread_id DESC);
+        """,
+        # Embedding cache shared across users and threads, keyed by hash of the chunk text and model
+        """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                text_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                embedding REAL[] NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (model, text_hash)
+            );
+        """,
+        # One row per distinct document index on disk, keyed by content hash
+        """
+            CREATE TABLE IF NOT EXISTS vector_indexes (
+                content_hash TEXT PRIMARY KEY,
+                doc_type TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """,
+        # Threads point at a shared index; the number of rows per content_hash is its reference count
+        """
+            CREATE TABLE IF NOT EXISTS thread_indexes (
+                thread_id UUID NOT NULL,
+                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                doc_type TEXT NOT NULL,
+                content_hash TEXT NOT NULL REFERENCES vector_indexes(content_hash),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (thread_id, doc_type)
+            );
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_thread_indexes_content_hash ON thread_indexes(content_hash);
+        """,
+        # Background ingestion jobs, polled by the sidebar
+        """
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                job_id UUID PRIMARY KEY,
+                thread_id UUID NOT NULL,
+                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                doc_type TEXT NOT NULL,
+                file_name TEXT,
+                status TEXT NOT NULL CHECK (status IN ('queued','running','done','failed')),
+                embedded_chunks INTEGER NOT NULL DEFAULT 0,
+                total_chunks INTEGER,
+                error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_thread ON ingestion_jobs(thread_id, user_id, doc_type, created_at DESC);
+        """,
+        # Shared tier of the tool result cache
+        """
+            CREATE TABLE IF NOT EXISTS tool_cache (
+                cache_key TEXT PRIMARY KEY,
+                tool_name TEXT NOT NULL,
+                result JSONB NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL
+            );
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_tool_cache_expires_at ON tool_cache(expires_at);
+        """,
+        # Display-ready copy of each turn, so reopening a thread does not decode checkpoints
+        """
+            CREATE TABLE IF NOT EXISTS messages (
+                id BIGSERIAL PRIMARY KEY,
+                thread_id UUID NOT NULL,
+                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                role TEXT NOT NULL CHECK (role IN ('user','assistant')),
+                content TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_messages_thread_id ON messages(thread_id, id DESC);
+        """,
+        # Deleting a thread removes its checkpoints and everything hanging off it. Checkpoint tables are created by
+        # the checkpointer's setup(); plpgsql resolves them when the trigger first fires.
+        """
+            CREATE OR REPLACE FUNCTION delete_thread_data() RETURNS trigger AS $$
+            BEGIN
+                DELETE FROM checkpoint_writes WHERE thread_id = OLD.thread_id::text;
+                DELETE FROM checkpoint_blobs WHERE thread_id = OLD.thread_id::text;
+                DELETE FROM checkpoints WHERE thread_id = OLD.thread_id::text;
+                DELETE FROM messages WHERE thread_id = OLD.thread_id;
+                DELETE FROM thread_indexes WHERE thread_id = OLD.thread_id;
+                DELETE FROM ingestion_jobs WHERE thread_id = OLD.thread_id;
+                RETURN OLD;
+            END;
+            $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_threads_delete_data ON threads;",
+        """
+            CREATE TRIGGER trg_threads_delete_data AFTER DELETE ON threads
+            FOR EACH ROW EXECUTE FUNCTION delete_thread_data();
+        """,
+        # Latest exchange rate snapshot per base currency, shared by all replicas
+        """
+            CREATE TABLE IF NOT EXISTS exchange_rates (
+                base TEXT PRIMARY KEY,
+                rates JSONB NOT NULL,
+                fetched_at TIMESTAMPTZ NOT NULL
+            );
+        """,
+    ]),
+    (2, "transcripts", [
+        # YouTube transcripts shared by every user and thread, fetched once per video
+        """
+            CREATE TABLE IF NOT EXISTS transcripts (
+                video_id TEXT PRIMARY KEY,
+                language TEXT NOT NULL,
+                snippets JSONB NOT NULL,
+                fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """,
+    ]),
+    (3, "pgvector", [
+        # Chunks of shared indexes for VECTOR_BACKEND=pgvector; removed with their vector_indexes row by garbage collection.
+        # Skipped on servers without the extension, where only the FAISS backend can be used.
+        # The embedding model is configurable, so the column takes vectors of any width; content hashes include the model,
+        # so all chunks of one index, and the queries searching it, still share a width. There is no ANN index: searches are
+        # always scoped to one content hash, whose chunks the primary key already groups, and a global index filtered by
+        # content_hash afterwards returns fewer than k rows once several documents are stored
+        """
+            DO $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'vector') THEN
+                    CREATE EXTENSION IF NOT EXISTS vector;
+                    CREATE TABLE IF NOT EXISTS vector_chunks (
+                        content_hash TEXT NOT NULL REFERENCES vector_indexes(content_hash) ON DELETE CASCADE,
+                        chunk_id INTEGER NOT NULL,
+                        content TEXT NOT NULL,
+                        metadata JSONB NOT NULL,
+                        embedding vector NOT NULL,
+                        PRIMARY KEY (content_hash, chunk_id)
+                    );
+                END IF;
+            END
+            $$;
+        """,
+    ]),
+]
+
+def _vector_literal(vector) -> str:
+    # pgvector's text form; avoids a client side adapter dependency
+    return "[" + ",".join(str(float(x)) for x in vector) + "]"
+
+SCHEMA_LOCK_ID = 727_000 # pg advisory lock serialising migrations across replicas
+SCHEMA_CHECK_SECONDS = float(os.getenv("SCHEMA_CHECK_SECONDS", "60"))
+_schema_checked_at: float | None = None
+
+def _schema_version(cur) -> int:
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+    if not cur.fetchone()['present']:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+    return cur.fetchone()['version']
+
+def init_schema() -> bool:
+    # Cheap enough to call on every rerun: reads the applied version at most every SCHEMA_CHECK_SECONDS and runs DDL only
+    # when it is behind, e.g. after the nightly branch reset dropped every table under a running replica.
+    # Returns True when the schema was found behind, so callers can recreate what they own as well
+    global _schema_checked_at
+    if _schema_checked_at is not None and time.monotonic() - _schema_checked_at < SCHEMA_CHECK_SECONDS:
+        return False
     try:
         with get_conn() as conn:
             with conn.cursor() as cur:
-                # Users Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id UUID PRIMARY KEY,
-                        email TEXT NOT NULL UNIQUE CHECK (email ~* '^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\\.[A-Za-z]{2,}$'),
-                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    );
-                """)
-
-                # Initialize Local User
-                cur.execute("""
-                    INSERT INTO users (id,email)
-                    VALUES (
-                        '00000000-0000-0000-0000-000000000001',
-                        'bot@phoenix.app'
-                    )
-                    ON CONFLICT (id) DO NOTHING;
-                """)
-                # Thread table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS threads (
-                            thread_id UUID PRIMARY KEY,
-                            user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                            thread_name TEXT NOT NULL,
-                            file_name TEXT,
-                            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                        );
-                """)
-                # Threads User index
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_threads_user_id ON threads(user_id);
-                """)
+                current = _schema_version(cur)
+            behind = current < MIGRATIONS[-1][0]
+            if behind:
+                with conn.transaction():
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                        cur.execute("""
+                            CREATE TABLE IF NOT EXISTS schema_migrations (
+                                version INTEGER PRIMARY KEY,
+                                name TEXT NOT NULL,
+                                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                            );
+                        """)
+                        # Re-read under the lock, another replica may have migrated meanwhile
+                        current = _schema_version(cur)
+                        for version, name, statements in MIGRATIONS:
+                            if version <= current:
+                                continue
+                            for statement in statements:
+                                cur.execute(statement)
+                            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s,%s)", (version, name))
+        _schema_checked_at = time.monotonic()
+        return behind
     except Exception as e:
         raise RuntimeError(f"Runtime Error on creating schema; Error: {e}") from e 
 
-def create_thread(thread_id:uuid.UUID, thread_name: str, user_id : uuid.UUID ):
+def create_thread(thread_id:uuid.UUID, thread_name: str, user_id : uuid.UUID, file_name:str | None = None):
+    # Returns the stored row so callers can add it to their thread list without refetching
     try:
         with get_conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    "INSERT INTO threads (thread_id, user_id, thread_name) VALUES (%s,%s,%s)",
-                    (thread_id, user_id, thread_name)
+                    "INSERT INTO threads (thread_id, user_id, thread_name, file_name) VALUES (%s,%s,%s,%s) RETURNING thread_id, thread_name, file_name, created_at",
+                    (thread_id, user_id, thread_name, file_name)
                 )
+                return cur.fetchone()
     except Exception as e:
         raise RuntimeError(f"Runtime Error on creating thread; Error: {e}") from e 
 
@@ -76,13 +303,312 @@ def update_file_name(file_name:str, thread_id:uuid.UUID,user_id:uuid.UUID):
     except Exception as e:
         raise RuntimeError(f"Runtime Error on updating filename; Error: {e}") from e
 
-def get_threads(user_id:uuid.UUID): # either user_id =  (UUID obj or None) and default = None for Optional usecases 
+def update_thread_name(thread_name:str, thread_id:uuid.UUID,user_id:uuid.UUID):
     try:
         with get_conn() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT thread_id, thread_name,file_name FROM threads WHERE user_id = %s ORDER BY created_at DESC",(user_id,))
-                return cur.fetchall()
+                cur.execute("UPDATE threads SET thread_name = %s WHERE thread_id = %s AND user_id = %s",(thread_name,thread_id,user_id))
 
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on updating thread name; Error: {e}") from e
+
+def get_threads_page(user_id:uuid.UUID, limit:int = 30, cursor:tuple | None = None):
+    # cursor = (created_at, thread_id) of the last row of the previous page; served by idx_threads_user_created
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                if cursor is None:
+                    cur.execute(
+                        "SELECT thread_id, thread_name, file_name, created_at FROM threads WHERE user_id = %s ORDER BY created_at DESC, thread_id DESC LIMIT %s",
+                        (user_id, limit)
+                    )
+                else:
+                    cur.execute(
+                        "SELECT thread_id, thread_name, file_name, created_at FROM threads WHERE user_id = %s AND (created_at, thread_id) < (%s, %s) ORDER BY created_at DESC, thread_id DESC LIMIT %s",
+                        (user_id, cursor[0], cursor[1], limit)
+                    )
+                return cur.fetchall()
     except Exception as e:
         raise RuntimeError(f"Cannot fetch threads for the current user; Error: {e}") from e
-    
+
+def delete_thread(thread_id:uuid.UUID, user_id:uuid.UUID):
+    # Checkpoints, messages, index references and jobs are removed by the trg_threads_delete_data trigger
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM threads WHERE thread_id = %s AND user_id = %s", (thread_id, user_id))
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on deleting thread; Error: {e}") from e
+
+def get_index_hash(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT content_hash FROM thread_indexes WHERE thread_id = %s AND user_id = %s AND doc_type = %s",
+                    (thread_id, user_id, doc_type)
+                )
+                row = cur.fetchone()
+                return row['content_hash'] if row else None
+    except Exception as e:
+        raise RuntimeError(f"Cannot fetch index for the thread; Error: {e}") from e
+
+def attach_index(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str, content_hash:str, exists:Callable[[], bool] | None = None) -> bool:
+    # Register and reference in one transaction so garbage collection never sees a fresh index with zero references.
+    # Garbage collection holds the same content hash lock while it removes an index's files, so `exists` sees them either
+    # kept or already gone; False means they are gone and nothing was attached
+    try:
+        with get_conn() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (content_hash,))
+                    if exists is not None and not exists():
+                        return False
+                    cur.execute(
+                        "INSERT INTO vector_indexes (content_hash, doc_type) VALUES (%s,%s) ON CONFLICT (content_hash) DO NOTHING",
+                        (content_hash, doc_type)
+                    )
+                    # First document of a thread is immutable, later ones are ignored
+                    cur.execute(
+                        "INSERT INTO thread_indexes (thread_id, user_id, doc_type, content_hash) VALUES (%s,%s,%s,%s) ON CONFLICT (thread_id, doc_type) DO NOTHING",
+                        (thread_id, user_id, doc_type, content_hash)
+                    )
+                    return True
+    except Exception as e:
+        raise RuntimeError(f"Cannot attach index to the thread; Error: {e}") from e
+
+def delete_unreferenced_indexes(remove:Callable[[str, str], None]) -> list:
+    # One transaction per index under its content hash lock: the registry row and the backend's copy (remove) go
+    # together, so a concurrent attach_index either runs first and keeps the index or runs after and finds it gone
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT content_hash FROM vector_indexes v
+                    WHERE NOT EXISTS (SELECT 1 FROM thread_indexes t WHERE t.content_hash = v.content_hash)
+                """)
+                candidates = [row['content_hash'] for row in cur.fetchall()]
+            removed = []
+            for content_hash in candidates:
+                with conn.transaction():
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (content_hash,))
+                        # Re-checked under the lock, a thread may have attached it since
+                        cur.execute("""
+                            DELETE FROM vector_indexes v
+                            WHERE content_hash = %s AND NOT EXISTS (SELECT 1 FROM thread_indexes t WHERE t.content_hash = v.content_hash)
+                            RETURNING content_hash, doc_type
+                        """, (content_hash,))
+                        row = cur.fetchone()
+                        if row is not None:
+                            remove(row['content_hash'], row['doc_type'])
+                            removed.append(row)
+            return removed
+    except Exception as e:
+        raise RuntimeError(f"Cannot delete unreferenced indexes; Error: {e}") from e
+
+def store_vector_chunks(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str, content_hash:str, rows:Iterable[tuple[str, dict, list[float]]]):
+    # Chunks, registration and the thread reference commit together, so other replicas only ever see complete indexes
+    try:
+        with get_conn() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    # Serialise replicas storing the same content; the second one only attaches
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (content_hash,))
+                    cur.execute(
+                        "INSERT INTO vector_indexes (content_hash, doc_type) VALUES (%s,%s) ON CONFLICT (content_hash) DO NOTHING",
+                        (content_hash, doc_type)
+                    )
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM vector_chunks WHERE content_hash = %s) AS stored", (content_hash,))
+                    if not cur.fetchone()['stored']:
+                        with cur.copy("COPY vector_chunks (content_hash, chunk_id, content, metadata, embedding) FROM STDIN") as copy:
+                            for chunk_id, (content, metadata, embedding) in enumerate(rows):
+                                copy.write_row((content_hash, chunk_id, content, json.dumps(metadata, default=str), _vector_literal(embedding)))
+                    cur.execute(
+                        "INSERT INTO thread_indexes (thread_id, user_id, doc_type, content_hash) VALUES (%s,%s,%s,%s) ON CONFLICT (thread_id, doc_type) DO NOTHING",
+                        (thread_id, user_id, doc_type, content_hash)
+                    )
+    except Exception as e:
+        raise RuntimeError(f"Cannot store vector chunks; Error: {e}") from e
+
+def attach_stored_vectors(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str, content_hash:str) -> bool:
+    # Key share lock keeps garbage collection from deleting the index between the check and the attach
+    try:
+        with get_conn() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1 FROM vector_indexes WHERE content_hash = %s FOR KEY SHARE", (content_hash,))
+                    if cur.fetchone() is None:
+                        return False
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM vector_chunks WHERE content_hash = %s) AS stored", (content_hash,))
+                    if not cur.fetchone()['stored']:
+                        return False
+                    cur.execute(
+                        "INSERT INTO thread_indexes (thread_id, user_id, doc_type, content_hash) VALUES (%s,%s,%s,%s) ON CONFLICT (thread_id, doc_type) DO NOTHING",
+                        (thread_id, user_id, doc_type, content_hash)
+                    )
+                    return True
+    except Exception as e:
+        raise RuntimeError(f"Cannot attach stored vectors to the thread; Error: {e}") from e
+
+def search_vector_chunks(content_hash:str, vectors:list[list[float]], k:int, with_embeddings:bool = False) -> list[list[dict]]:
+    # Every query vector in one round trip; results come back grouped per query, nearest first. Exact search over the
+    # document's chunks, read through the (content_hash, chunk_id) primary key
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT q.ord, c.content, c.metadata, c.distance{", c.embedding::text AS embedding" if with_embeddings else ""}
+                    FROM unnest(%s::text[]) WITH ORDINALITY AS q(v, ord)
+                    CROSS JOIN LATERAL (
+                        SELECT content, metadata, embedding, embedding <-> q.v::vector AS distance
+                        FROM vector_chunks
+                        WHERE content_hash = %s
+                        ORDER BY embedding <-> q.v::vector
+                        LIMIT %s
+                    ) c
+                    ORDER BY q.ord, c.distance
+                """, ([_vector_literal(v) for v in vectors], content_hash, k))
+                results: list[list[dict]] = [[] for _ in vectors]
+                for row in cur.fetchall():
+                    results[row['ord'] - 1].append(row)
+                return results
+    except Exception as e:
+        raise RuntimeError(f"Cannot search vector chunks; Error: {e}") from e
+
+def create_job(job_id:uuid.UUID, thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str, file_name:str | None = None):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO ingestion_jobs (job_id, thread_id, user_id, doc_type, file_name, status) VALUES (%s,%s,%s,%s,%s,'queued')",
+                    (job_id, thread_id, user_id, doc_type, file_name)
+                )
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on creating ingestion job; Error: {e}") from e
+
+def update_job(job_id:uuid.UUID, status:str | None = None, embedded_chunks:int | None = None, total_chunks:int | None = None, error:str | None = None):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE ingestion_jobs SET
+                        status = COALESCE(%s, status),
+                        embedded_chunks = COALESCE(%s, embedded_chunks),
+                        total_chunks = COALESCE(%s, total_chunks),
+                        error = COALESCE(%s, error),
+                        updated_at = NOW()
+                    WHERE job_id = %s
+                    """,
+                    (status, embedded_chunks, total_chunks, error, job_id)
+                )
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on updating ingestion job; Error: {e}") from e
+
+def get_job(job_id:uuid.UUID):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT * FROM ingestion_jobs WHERE job_id = %s", (job_id,))
+                return cur.fetchone()
+    except Exception as e:
+        raise RuntimeError(f"Cannot fetch ingestion job; Error: {e}") from e
+
+def get_active_job(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str, stale_after_seconds:int = 600):
+    # Jobs that stopped reporting (process restarted mid ingest) are not considered active
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT * FROM ingestion_jobs
+                    WHERE thread_id = %s AND user_id = %s AND doc_type = %s
+                      AND status IN ('queued','running') AND updated_at > NOW() - make_interval(secs => %s)
+                    ORDER BY created_at DESC LIMIT 1
+                    """,
+                    (thread_id, user_id, doc_type, stale_after_seconds)
+                )
+                return cur.fetchone()
+    except Exception as e:
+        raise RuntimeError(f"Cannot fetch ingestion job; Error: {e}") from e
+
+def save_messages(thread_id:uuid.UUID, user_id:uuid.UUID, messages:list[dict]):
+    # messages: [{"role": "user" | "assistant", "content": str}, ...] in display order
+    if not messages:
+        return
+    try:
+        with get_conn() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.executemany(
+                        "INSERT INTO messages (thread_id, user_id, role, content) VALUES (%s,%s,%s,%s)",
+                        [(thread_id, user_id, m['role'], m['content']) for m in messages]
+                    )
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on saving messages; Error: {e}") from e
+
+def backfill_messages(thread_id:uuid.UUID, user_id:uuid.UUID, messages:list[dict]) -> bool:
+    # messages: the thread's display history rebuilt from its checkpoint. Threads started before the messages table and
+    # continued after it hold only their newer turns here, so the rows are replaced when they have fewer user turns.
+    # Turns are compared rather than rows because a turn's assistant text is one row here but may span several messages
+    turns = sum(m['role'] == 'user' for m in messages)
+    try:
+        with get_conn() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (str(thread_id),))
+                    cur.execute(
+                        "SELECT COUNT(*) AS turns FROM messages WHERE thread_id = %s AND user_id = %s AND role = 'user'",
+                        (thread_id, user_id)
+                    )
+                    if cur.fetchone()['turns'] >= turns:
+                        return False
+                    cur.execute("DELETE FROM messages WHERE thread_id = %s AND user_id = %s", (thread_id, user_id))
+                    cur.executemany(
+                        "INSERT INTO messages (thread_id, user_id, role, content) VALUES (%s,%s,%s,%s)",
+                        [(thread_id, user_id, m['role'], m['content']) for m in messages]
+                    )
+                    return True
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on backfilling messages; Error: {e}") from e
+
+def get_messages(thread_id:uuid.UUID, user_id:uuid.UUID, limit:int = 50, before_id:int | None = None):
+    # Newest page first through the (thread_id, id DESC) index, returned in display order
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                if before_id is None:
+                    cur.execute(
+                        "SELECT id, role, content FROM messages WHERE thread_id = %s AND user_id = %s ORDER BY id DESC LIMIT %s",
+                        (thread_id, user_id, limit)
+                    )
+                else:
+                    cur.execute(
+                        "SELECT id, role, content FROM messages WHERE thread_id = %s AND user_id = %s AND id < %s ORDER BY id DESC LIMIT %s",
+                        (thread_id, user_id, before_id, limit)
+                    )
+                return cur.fetchall()[::-1]
+    except Exception as e:
+        raise RuntimeError(f"Cannot fetch messages for the thread; Error: {e}") from e
+
+def get_stored_transcript(video_id:str):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT snippets FROM transcripts WHERE video_id = %s", (video_id,))
+                row = cur.fetchone()
+                return row['snippets'] if row else None
+    except Exception as e:
+        raise RuntimeError(f"Cannot fetch transcript; Error: {e}") from e
+
+def save_transcript(video_id:str, language:str, snippets:list):
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO transcripts (video_id, language, snippets) VALUES (%s,%s,%s) ON CONFLICT (video_id) DO NOTHING",
+                    (video_id, language, Jsonb(snippets))
+                )
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on saving transcript; Error: {e}") from e
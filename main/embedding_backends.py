@@ -0,0 +1,112 @@
+import os,hashlib,math,struct,threading,functools
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+# endpoint: HF inference API; local: sentence-transformers in this process; stub: deterministic vectors for offline tests
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "endpoint").lower()
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+
+STUB_EMBEDDING_DIMENSIONS = int(os.getenv("STUB_EMBEDDING_DIMENSIONS", "384")) # Same width as all-MiniLM-L6-v2
+
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0")) # torch intra-op threads; 0 keeps the torch default
+LOCAL_EMBEDDING_RUNTIME = os.getenv("LOCAL_EMBEDDING_RUNTIME", "torch").lower() # torch or onnx; onnx needs sentence-transformers[onnx]
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE") # e.g. onnx/model_qint8_avx2.onnx for a quantised model
+LOCAL_EMBEDDING_QUANTIZE = os.getenv("LOCAL_EMBEDDING_QUANTIZE", "false").lower() == "true" # int8 dynamic quantisation of torch Linear layers
+
+
+# functools.cache does not stop two threads missing at once and both loading the weights
+_MODEL_LOAD_LOCK = threading.Lock()
+
+
+@functools.cache
+def _load_sentence_transformer(model_name:str, runtime:str, onnx_file:str | None, quantize:bool, threads:int):
+    # One copy of the weights per process, shared by every session and ingestion worker
+    from sentence_transformers import SentenceTransformer
+    if runtime == "onnx":
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class LocalEmbeddings(Embeddings):
+    def __init__(self, model_name:str = EMBEDDING_MODEL_NAME, batch_size:int = LOCAL_EMBEDDING_BATCH_SIZE, threads:int = LOCAL_EMBEDDING_THREADS,
+                 runtime:str = LOCAL_EMBEDDING_RUNTIME, onnx_file:str | None = LOCAL_EMBEDDING_ONNX_FILE, quantize:bool = LOCAL_EMBEDDING_QUANTIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self.runtime = runtime
+        self.onnx_file = onnx_file
+        self.quantize = quantize
+        # Inference already uses every configured core; parallel ingestion batches queue here instead of oversubscribing the CPU
+        self._lock = threading.Lock()
+
+    @property
+    def cache_name(self) -> str:
+        # Quantised runtimes give slightly different vectors, so they get their own entries in the embedding cache
+        if self.runtime == "onnx" and self.onnx_file:
+            return f"{self.model_name}@onnx:{self.onnx_file}"
+        if self.quantize:
+            return f"{self.model_name}@qint8"
+        return self.model_name
+
+    def _encode(self, texts:List[str]) -> List[List[float]]:
+        with _MODEL_LOAD_LOCK:
+            model = _load_sentence_transformer(self.model_name, self.runtime, self.onnx_file, self.quantize, self.threads)
+        with self._lock:
+            vectors = model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_documents(self, texts:List[str]) -> List[List[float]]:
+        return self._encode(texts) if texts else []
+
+    def embed_query(self, text:str) -> List[float]:
+        return self._encode([text])[0]
+
+
+class StubEmbeddings(Embeddings):
+    # Unit vectors derived from a hash of the text: identical texts match exactly, no network or model download needed
+    cache_name = "stub"
+
+    def __init__(self, dimensions:int = STUB_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _vector(self, text:str) -> List[float]:
+        values = []
+        counter = 0
+        while len(values) < self.dimensions:
+            digest = hashlib.sha256(f"{counter}\x00{text}".encode("utf-8")).digest()
+            values.extend(v / 2**31 for v in struct.unpack("<8i", digest))
+            counter += 1
+        values = values[:self.dimensions]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def embed_documents(self, texts:List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text:str) -> List[float]:
+        return self._vector(text)
+
+
+def _endpoint() -> Embeddings:
+    from langchain_huggingface.embeddings import HuggingFaceEndpointEmbeddings
+    return HuggingFaceEndpointEmbeddings(model=EMBEDDING_MODEL_NAME)
+
+
+EMBEDDING_BACKENDS = {"endpoint": _endpoint, "local": LocalEmbeddings, "stub": StubEmbeddings}
+
+def create_embeddings(backend:str = EMBEDDING_BACKEND) -> Embeddings:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend]()
+
+def cache_name(embeddings:Embeddings) -> str:
+    # Model key in the embedding cache; the endpoint and unquantised local runs share entries
+    return getattr(embeddings, "cache_name", EMBEDDING_MODEL_NAME)
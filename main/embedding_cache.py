@@ -0,0 +1,98 @@
+import os,hashlib,logging
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from cache import LRUCache
+from database_utils import get_conn
+
+logger = logging.getLogger(__name__)
+
+# float32 arrays, as stored in Postgres (REAL[]): ~1.5 KB per 384 dimension vector, against ~12 KB as a list of floats
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "64"))
+
+def vector_cache(max_mb:float, max_entries:int = 1_000_000) -> LRUCache:
+    # In-memory tier for vectors, bounded by the bytes of the stored arrays
+    return LRUCache(max_entries=max_entries, max_bytes=int(max_mb * 1024 * 1024), sizeof=lambda vector: vector.nbytes)
+
+def embedding_key(text:str, model_name:str, query:bool = False) -> str:
+    # Content addressed: the same chunk embedded by the same model always maps to the same key, whichever user or thread sent it.
+    # Queries get their own namespace, since models with query prompts embed them differently from documents
+    namespace = f"{model_name}\x00query" if query else model_name
+    return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+# Wraps any Embeddings object; lookups go memory -> Postgres -> remote model, and only the misses are sent to the model
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings:Embeddings, model_name:str, memory_cache:LRUCache | None = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.memory_cache = memory_cache if memory_cache is not None else vector_cache(EMBEDDING_CACHE_MAX_MB)
+
+    def _fetch_from_db(self, keys:List[str]) -> dict:
+        if not keys:
+            return {}
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT text_hash, embedding FROM embedding_cache WHERE model = %s AND text_hash = ANY(%s)",
+                        (self.model_name, keys)
+                    )
+                    return {row['text_hash']: row['embedding'] for row in cur.fetchall()}
+        except Exception as e:
+            # The cache is an optimisation; never fail an ingest because it is unreachable
+            logger.warning(f"Embedding cache lookup failed; Error: {e}")
+            return {}
+
+    def _store_in_db(self, rows:List[tuple]):
+        if not rows:
+            return
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.executemany(
+                        "INSERT INTO embedding_cache (text_hash, model, embedding) VALUES (%s,%s,%s) ON CONFLICT (model, text_hash) DO NOTHING",
+                        [(key, self.model_name, vector) for key, vector in rows]
+                    )
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed; Error: {e}")
+
+    def _lookup(self, keys:List[str]) -> dict:
+        found = {}
+        for key in keys:
+            vector = self.memory_cache.get(key)
+            if vector is not None:
+                found[key] = vector
+        from_db = self._fetch_from_db([key for key in dict.fromkeys(keys) if key not in found])
+        for key, vector in from_db.items():
+            found[key] = np.asarray(vector, dtype=np.float32)
+            self.memory_cache.set(key, found[key])
+        return found
+
+    def _remember(self, rows:List[tuple]) -> dict:
+        remembered = {}
+        for key, vector in rows:
+            remembered[key] = np.asarray(vector, dtype=np.float32)
+            self.memory_cache.set(key, remembered[key])
+        self._store_in_db(rows)
+        return remembered
+
+    def embed_documents(self, texts:List[str]) -> List[List[float]]:
+        keys = [embedding_key(text, self.model_name) for text in texts]
+        found = self._lookup(keys)
+
+        # Deduplicate misses so a chunk repeated inside the same document is embedded once
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(self._remember(list(zip(missing.keys(), vectors))))
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text:str) -> List[float]:
+        key = embedding_key(text, self.model_name, query=True)
+        found = self._lookup([key])
+        if key not in found:
+            found = self._remember([(key, self.embeddings.embed_query(text))])
+        return found[key].tolist()
+
+    def stats(self) -> dict:
+        return self.memory_cache.stats()
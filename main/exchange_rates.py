@@ -0,0 +1,115 @@
+import os,time,threading,asyncio,logging
+from psycopg.types.json import Jsonb
+from database_utils import get_conn
+from http_client import http_client,async_http_client
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_API_URL = os.getenv("EXCHANGE_API_URL", "https://v6.exchangerate-api.com/v6")
+RATE_TABLE_BASE = os.getenv("RATE_TABLE_BASE", "USD")
+RATE_REFRESH_SECONDS = float(os.getenv("RATE_REFRESH_SECONDS", "3600"))
+RATE_TABLE_DB = os.getenv("RATE_TABLE_DB", "false").lower() == "true"
+
+
+# One `latest/{base}` snapshot answers every pair: rate(a -> b) = rates[b] / rates[a]
+class RateTable:
+    def __init__(self, base:str = RATE_TABLE_BASE, refresh_seconds:float = RATE_REFRESH_SECONDS, use_db:bool = RATE_TABLE_DB):
+        self.base = base
+        self.refresh_seconds = refresh_seconds
+        self.use_db = use_db
+        self._rates: dict[str, float] = {}
+        self._fetched_at = 0.0 # wall clock, comparable across replicas
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock() # Binds to the graph's event loop on first contention
+        self.upstream_fetches = 0
+
+    def _is_fresh(self) -> bool:
+        return bool(self._rates) and time.time() - self._fetched_at < self.refresh_seconds
+
+    def _url(self) -> str:
+        return f"{EXCHANGE_API_URL}/{os.getenv('EXCHANGE_API_KEY')}/latest/{self.base}"
+
+    def _load_from_db(self) -> bool:
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT rates, EXTRACT(EPOCH FROM fetched_at) AS fetched_at FROM exchange_rates WHERE base = %s", (self.base,))
+                    row = cur.fetchone()
+        except Exception as e:
+            logger.warning(f"Could not read shared rate table; Error: {e}")
+            return False
+        if row is None or time.time() - float(row['fetched_at']) >= self.refresh_seconds:
+            return False
+        self._rates, self._fetched_at = row['rates'], float(row['fetched_at'])
+        return True
+
+    def _save_to_db(self):
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO exchange_rates (base, rates, fetched_at) VALUES (%s,%s,to_timestamp(%s))
+                        ON CONFLICT (base) DO UPDATE SET rates = EXCLUDED.rates, fetched_at = EXCLUDED.fetched_at
+                        """,
+                        (self.base, Jsonb(self._rates), self._fetched_at)
+                    )
+        except Exception as e:
+            logger.warning(f"Could not write shared rate table; Error: {e}")
+
+    def _apply_snapshot(self, data:dict):
+        self._rates = {code.upper(): float(rate) for code, rate in data["conversion_rates"].items()}
+        self._fetched_at = time.time()
+        self.upstream_fetches += 1
+
+    def refresh(self, force:bool = False):
+        # Single flight: concurrent callers wait for one fetch instead of each spending quota
+        with self._lock:
+            if not force and self._is_fresh():
+                return
+            if not force and self.use_db and self._load_from_db():
+                return
+            self._apply_snapshot(http_client.get_json(self._url(), name="get_conversion_rate"))
+            if self.use_db:
+                self._save_to_db()
+
+    async def arefresh(self, force:bool = False):
+        # Single flight for coroutines on the event loop; database reads and writes run in a worker thread so the loop
+        # never blocks on Postgres
+        async with self._async_lock:
+            if not force and self._is_fresh():
+                return
+            if not force and self.use_db and await asyncio.to_thread(self._load_from_db):
+                return
+            self._apply_snapshot(await async_http_client.get_json(self._url(), name="get_conversion_rate"))
+            if self.use_db:
+                await asyncio.to_thread(self._save_to_db)
+
+    def _cross_rate(self, base_currency:str, target_currency:str) -> float:
+        base_currency, target_currency = base_currency.strip().upper(), target_currency.strip().upper()
+        rates = self._rates
+        for code in (base_currency, target_currency):
+            if code not in rates:
+                raise ValueError(f"Unsupported currency code: {code}")
+        return rates[target_currency] / rates[base_currency]
+
+    def rate(self, base_currency:str, target_currency:str) -> float:
+        if not self._is_fresh():
+            self.refresh()
+        return self._cross_rate(base_currency, target_currency)
+
+    async def arate(self, base_currency:str, target_currency:str) -> float:
+        if not self._is_fresh():
+            await self.arefresh()
+        return self._cross_rate(base_currency, target_currency)
+
+    def stats(self) -> dict:
+        return {
+            "base": self.base,
+            "currencies": len(self._rates),
+            "age_seconds": time.time() - self._fetched_at if self._rates else None,
+            "upstream_fetches": self.upstream_fetches,
+        }
+
+
+rate_table = RateTable()
@@ -0,0 +1,159 @@
+import os,time,pickle,threading,logging
+from collections import deque
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# auto picks by chunk count; flat, hnsw or ivf forces a structure
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+FAISS_QUANTIZATION = os.getenv("FAISS_QUANTIZATION", "none").lower() # none, sq8 or pq
+# Below this an exact search is fast enough and costs no recall. Capped uploads stay well under it (a 2 MB PDF or a long
+# transcript is a few thousand chunks, where flat search takes a fraction of HNSW's time), so auto keeps them flat; the
+# approximate structures serve FAISS_INDEX_TYPE overrides, quantised indexes and deployments that raise the upload cap
+FAISS_FLAT_MAX = int(os.getenv("FAISS_FLAT_MAX", "20000"))
+FAISS_HNSW_MAX = int(os.getenv("FAISS_HNSW_MAX", "500000")) # Above this IVF builds faster and uses less memory than HNSW
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_MIN_RECALL = float(os.getenv("FAISS_MIN_RECALL", "0.9")) # Keep the exact index when an approximate one scores below this
+FAISS_RECALL_SAMPLE = int(os.getenv("FAISS_RECALL_SAMPLE", "64"))
+PQ_MIN_TRAIN = 39 * 256 # PQ trains 256 centroids per sub-quantiser; faiss wants ~39 points per centroid
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"
+RECALL_K = 5
+
+# Recent build decisions, for stats
+_BUILD_REPORTS: deque = deque(maxlen=100)
+_REPORTS_LOCK = threading.Lock()
+
+
+def choose_factory(n:int, d:int, index_type:str = FAISS_INDEX_TYPE, quantization:str = FAISS_QUANTIZATION) -> str:
+    # faiss.index_factory description for n vectors of d dimensions
+    if index_type == "auto":
+        index_type = "flat" if n < FAISS_FLAT_MAX else "hnsw" if n < FAISS_HNSW_MAX else "ivf"
+    if quantization == "pq" and n < PQ_MIN_TRAIN:
+        quantization = "sq8" # Training fails below 256 vectors and gives poor codes below PQ_MIN_TRAIN; SQ8 needs no clustering
+    pq_m = next(m for m in (d // 8, d // 4, d // 2, d) if m and d % m == 0) # PQ needs the dimension split evenly
+    codec = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_m}"}[quantization]
+    if index_type == "flat":
+        return codec
+    if index_type == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}" if codec == "Flat" else f"HNSW{FAISS_HNSW_M}_{codec}"
+    if index_type == "ivf":
+        nlist = max(1, min(int(4 * n ** 0.5), n // 39)) # faiss wants ~39 training points per list
+        return f"IVF{nlist},{codec}"
+    raise ValueError(f"Unknown FAISS_INDEX_TYPE {index_type!r}")
+
+
+def _prepare_for_search(index):
+    import faiss
+    # IVF indexes need a direct map for reconstruct(), which MMR search uses
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    params = faiss.ParameterSpace()
+    for name, value in (("efSearch", FAISS_HNSW_EF_SEARCH), ("nprobe", FAISS_IVF_NPROBE)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass # Parameter does not apply to this index type
+
+
+def _measure(index, queries:np.ndarray, truth:np.ndarray | None) -> tuple[float, float]:
+    start = time.perf_counter()
+    _, ids = index.search(queries, RECALL_K)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    if truth is None:
+        return 1.0, latency_ms
+    recall = np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(ids, truth)])
+    return float(recall), latency_ms
+
+
+def optimize_index(vector_store) -> dict:
+    """
+    Swap the flat index built during ingestion for the structure chosen by chunk count. Vector positions do not change,
+    so the docstore mapping stays valid. The choice is checked against the exact index on a sample of stored vectors and
+    reverted when recall falls below FAISS_MIN_RECALL. Returns the recorded recall and latency.
+    """
+    import faiss
+    flat = vector_store.index
+    n, d = flat.ntotal, flat.d
+    factory = choose_factory(n, d)
+    vectors = flat.reconstruct_n(0, n)
+    sample = vectors[np.random.default_rng(0).choice(n, size=min(FAISS_RECALL_SAMPLE, n), replace=False)]
+    _, truth = flat.search(sample, RECALL_K)
+    _, flat_latency = _measure(flat, sample, None)
+    report = {"vectors": n, "factory": factory, "flat_latency_ms": flat_latency, "recall": 1.0, "latency_ms": flat_latency, "kept": "Flat"}
+
+    if factory != "Flat":
+        start = time.perf_counter()
+        index = faiss.index_factory(d, factory)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        _prepare_for_search(index)
+        report["build_seconds"] = time.perf_counter() - start
+        report["recall"], report["latency_ms"] = _measure(index, sample, truth)
+        if report["recall"] >= FAISS_MIN_RECALL:
+            vector_store.index = index
+            report["kept"] = factory
+        else:
+            logger.warning(f"{factory} recall {report['recall']:.2f} below {FAISS_MIN_RECALL}; keeping the exact index")
+
+    with _REPORTS_LOCK:
+        _BUILD_REPORTS.append(report)
+    logger.info(f"Index for {n} vectors: {report['kept']} (recall@{RECALL_K} {report['recall']:.2f}, {report['latency_ms']:.3f} ms/query)")
+    return report
+
+
+def load_index(folder:Path, index_name:str, embeddings):
+    """
+    FAISS.load_local, except the index file is memory mapped when FAISS_MMAP is set, so processes caching the same
+    index share its pages through the OS page cache instead of each reading a private copy.
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    path = str(folder / f"{index_name}.faiss")
+    index, mode = None, "read"
+    if FAISS_MMAP:
+        # IO_FLAG_MMAP_IFC (faiss >= 1.9) maps the codes of flat, SQ, PQ and HNSW storage, but IVF indexes reject it
+        # ("mmap only supported for File objects" on faiss 1.15); IO_FLAG_MMAP alone maps their inverted lists
+        attempts = [("mmap_codes", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP_IFC)] if hasattr(faiss, "IO_FLAG_MMAP_IFC") else []
+        attempts.append(("mmap_lists", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY))
+        for attempt, flags in attempts:
+            try:
+                index = faiss.read_index(path, flags)
+            except RuntimeError as e:
+                logger.debug(f"{attempt} read of {path} failed; Error: {e}")
+                continue
+            # Without mapped codes only the inverted lists of an IVF index are shared
+            if attempt == "mmap_codes" or faiss.try_extract_index_ivf(index) is not None:
+                mode = attempt
+            break
+    if index is None:
+        index = faiss.read_index(path)
+    logger.info(f"Loaded {index_name} ({type(index).__name__}, {index.ntotal} vectors) with {mode}")
+    _prepare_for_search(index)
+    with open(folder / f"{index_name}.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f) # Written by save_local; the docstore is still read whole
+    vector_store = FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+    vector_store.mmapped = mode != "read"
+    return vector_store
+
+
+def index_memory_bytes(vector_store) -> int:
+    # Private memory held by the index; mapped pages are shared and can be dropped by the OS
+    index = vector_store.index
+    if getattr(vector_store, "mmapped", False):
+        return 0
+    try:
+        code_size = index.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    graph = FAISS_HNSW_M * 2 * 4 if hasattr(index, "hnsw") else 0 # Neighbour lists of the bottom HNSW layer
+    return index.ntotal * (code_size + graph)
+
+
+def get_index_build_stats() -> list[dict]:
+    with _REPORTS_LOCK:
+        return list(_BUILD_REPORTS)
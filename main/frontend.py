@@ -1,10 +1,14 @@
 import streamlit as st
-from backend import graph,rename_chat_model
+from bootstrap import get_app
+from async_runtime import run_async,iter_async
 from langgraph.checkpoint.memory import RunnableConfig
 from langchain_core.messages import HumanMessage,AIMessage,ToolMessage
 import uuid,os
-from database_utils import create_thread, get_threads,init_schema,update_file_name
-from RAG import ingest_pdf
+from database_utils import create_thread,update_file_name,save_messages,get_messages,backfill_messages
+from thread_list import ThreadListCache
+from titles import placeholder_title,submit_title_job
+from jobs import submit_ingest_job,get_job_status
+from metrics import REGISTRY
 
 # Load env variables from st.secrets
 
@@ -33,8 +37,11 @@ if "GROQ_API_KEY" not in os.environ:
     os.environ['GROQ_API_KEY'] = st.secrets['GROQ_API_KEY']
 
 
+# Built on the first script run of the process, reused by every rerun and session
+app = get_app()
+graph, rename_chat_model, ASYNC_GRAPH = app.graph, app.rename_chat_model, app.async_mode
+
 # ********************************************************* Utils ****************************************************
-init_schema()
 
 def _gen_thread_id():
     return uuid.uuid4()
@@ -45,7 +52,9 @@ def _get_default_user_id():
 def reset_session():
     st.session_state['thread'] = {"thread_id":_gen_thread_id(),"thread_name":None,"file_name":None}
     st.session_state["message_history"] = []
+    st.session_state["oldest_message_id"] = None
     st.session_state['thread_file'] = None
+    st.session_state['ingest_job'] = None
     st.rerun() # After reset rerun the state
 
 def serialize_message(message):
@@ -58,14 +67,39 @@ def serialize_message(message):
         return None
 
     
-def load_messages(thread):
+MESSAGE_PAGE_SIZE = 50
+
+def _checkpoint_messages(thread) -> list[dict]:
     temp = []
-    message_history = graph.get_state({"configurable":{"thread_id":thread['thread_id']}}).values['messages']
+    config = {"configurable":{"thread_id":thread['thread_id']}}
+    state = run_async(graph.aget_state(config)) if ASYNC_GRAPH else graph.get_state(config)
+    message_history = state.values.get('messages', [])
     for message in message_history:
         serialized  = serialize_message(message) #If ToolMessage returns None 
         if serialized : 
             temp.append(serialized)
-    st.session_state["message_history"] = temp
+    return temp
+
+def load_messages(thread):
+    # Turns from before the messages table exist only in the checkpoint; decode it once per thread and session to backfill.
+    # Later turns are saved as they happen, so the table stays complete after that
+    checked = st.session_state.setdefault("backfill_checked", set())
+    if thread['thread_id'] not in checked:
+        backfill_messages(thread['thread_id'], st.session_state['user_id'], _checkpoint_messages(thread))
+        checked.add(thread['thread_id'])
+    rows = get_messages(thread['thread_id'], st.session_state['user_id'], limit=MESSAGE_PAGE_SIZE + 1)
+    # One extra row tells whether an older page exists
+    has_more = len(rows) > MESSAGE_PAGE_SIZE
+    rows = rows[1:] if has_more else rows
+    st.session_state["message_history"] = [{"role": r['role'], "content": r['content']} for r in rows]
+    st.session_state["oldest_message_id"] = rows[0]['id'] if has_more else None
+
+def load_older_messages(thread):
+    rows = get_messages(thread['thread_id'], st.session_state['user_id'], limit=MESSAGE_PAGE_SIZE + 1, before_id=st.session_state["oldest_message_id"])
+    has_more = len(rows) > MESSAGE_PAGE_SIZE
+    rows = rows[1:] if has_more else rows
+    st.session_state["message_history"] = [{"role": r['role'], "content": r['content']} for r in rows] + st.session_state["message_history"]
+    st.session_state["oldest_message_id"] = rows[0]['id'] if has_more and rows else None
 
 
 # ********************************************************* Session ****************************************************
@@ -76,15 +110,26 @@ if "thread" not in st.session_state:
     st.session_state['thread'] = {"thread_id":_gen_thread_id(),"thread_name":None,"file_name":None}
 
 if "thread_list" not in st.session_state:
-    st.session_state['thread_list'] = get_threads(user_id= st.session_state['user_id'])
+    st.session_state['thread_list'] = ThreadListCache(user_id= st.session_state['user_id'])
 
 if "message_history" not in st.session_state: # session_state is a dict
     st.session_state["message_history"] = []
 
+# id of the oldest message shown; None when the whole thread is loaded
+if "oldest_message_id" not in st.session_state:
+    st.session_state["oldest_message_id"] = None
+
 # When we click new chat, the uploaded file is ingested again because uploader(session-scoped,) does not reset; To make it thread scoped, Bind the uploader to a thread-specific key and reset it on thread change.
 if "thread_file" not in st.session_state:
     st.session_state["thread_file"] = ()
 
+if "ingest_job" not in st.session_state:
+    st.session_state["ingest_job"] = None
+
+# thread_id -> Future of the generated title
+if "title_jobs" not in st.session_state:
+    st.session_state["title_jobs"] = {}
+
 
   
 # *********************************************************Sidebar****************************************************
@@ -104,14 +149,55 @@ if file:
     # Check if the new file is not same as the file uploaded before in the same thread. We can upload the same file accross multiple threads
     if st.session_state["thread_file"] != (current_thread_id,new_file_id):
         file_bytes = file.read()
-        ingest_pdf(file_bytes=file_bytes,thread_id=st.session_state['thread']['thread_id'],user_id = st.session_state['user_id'])
+        # Ingest in the background worker pool, the sidebar polls the job below
+        st.session_state['ingest_job'] = submit_ingest_job(thread_id=st.session_state['thread']['thread_id'],user_id = st.session_state['user_id'],file_bytes=file_bytes,file_name=file.name)
         st.session_state["thread_file"] = (current_thread_id,new_file_id)
         st.session_state['thread']['file_name'] = file.name
         update_file_name(file_name=file.name,thread_id=st.session_state['thread']['thread_id'],user_id=st.session_state['user_id'])
-        # Get threads from the database and rerun. Always rerun after fetching,resetting,changing threads
-        st.session_state['thread_list'] = get_threads(user_id=st.session_state['user_id'])
+        # Update the cached entry in place and rerun. Always rerun after fetching,resetting,changing threads
+        st.session_state['thread_list'].update(current_thread_id, file_name=file.name)
         st.rerun()
 
+# Poll the running ingestion job without rerunning the whole script
+@st.fragment(run_every=1.0)
+def show_ingest_progress():
+    job_id = st.session_state['ingest_job']
+    if not job_id:
+        return
+    job = get_job_status(job_id)
+    if job is None:
+        return
+    if job['status'] in ("queued", "running"):
+        embedded, total = job['embedded_chunks'], job['total_chunks']
+        st.progress(min(1.0, embedded / total) if total else 0.0, text=f"Indexing {job['file_name']}... {embedded} chunks embedded")
+    else:
+        st.session_state['ingest_job'] = None
+        if job['status'] == "failed":
+            st.session_state['ingest_error'] = job['error']
+        st.rerun(scope="app")
+
+# Swap placeholder titles for generated ones as they finish
+@st.fragment(run_every=1.0)
+def apply_generated_titles():
+    jobs = st.session_state['title_jobs']
+    done = [thread_id for thread_id, future in jobs.items() if future.done()]
+    if not done:
+        return
+    for thread_id in done:
+        title = jobs.pop(thread_id).result()
+        if title:
+            st.session_state['thread_list'].update(thread_id, thread_name=title)
+            if st.session_state['thread']['thread_id'] == thread_id:
+                st.session_state['thread']['thread_name'] = title
+    st.rerun(scope="app")
+
+with st.sidebar:
+    show_ingest_progress()
+    apply_generated_titles()
+
+if st.session_state.pop('ingest_error', None):
+    st.sidebar.error("Could not index the PDF, please upload it again")
+
 # print(st.session_state['thread'])
 if st.session_state['thread']['file_name']:
     st.sidebar.caption(f"Context File : {st.session_state['thread']['file_name']}")
@@ -119,7 +205,7 @@ if st.session_state['thread']['file_name']:
 # After messsages load Recent conversations
 st.sidebar.caption("Recents")
 
-for thread in (st.session_state['thread_list']):
+for thread in (st.session_state['thread_list'].items):
     if thread['thread_name']:
         if st.sidebar.button(thread['thread_name'],width="stretch",key=f"thread_button_{thread['thread_id']}" ): # Each time you clcik a button whole script runs again
             st.session_state['thread'] = thread.copy() # Create a shallow copy of the dict so session_state gets a new object; # Without .copy(), this would only assign another pointer reference to the same dict.
@@ -127,8 +213,30 @@ for thread in (st.session_state['thread_list']):
             load_messages(st.session_state['thread'])
             st.rerun() # Fixed double click issues; 
 
+# Older threads only on demand
+if st.session_state['thread_list'].has_more:
+    if st.sidebar.button("Load more", width="stretch"):
+        st.session_state['thread_list'].load_more()
+        st.rerun()
+
+# Operator view of the in-process metrics registry; off unless PHOENIX_ADMIN_PANEL is set
+if os.getenv("PHOENIX_ADMIN_PANEL", "false").lower() == "true":
+    with st.sidebar.expander("Metrics"):
+        summary = REGISTRY.summary()
+        st.caption("Latency")
+        st.dataframe([{**row, "labels": ", ".join(f"{k}={v}" for k, v in row["labels"].items())} for row in summary["histograms"]], hide_index=True)
+        st.caption("Counters")
+        st.dataframe([{**row, "labels": ", ".join(f"{k}={v}" for k, v in row["labels"].items())} for row in summary["counters"]], hide_index=True)
+        st.caption("Caches, pools and clients")
+        st.json(REGISTRY.collect(), expanded=False)
+
 # ********************************************************* UI ***********************************************************
-# Load previous messages
+# Load previous messages, older pages only on demand
+if st.session_state["oldest_message_id"] is not None:
+    if st.button("Load older messages"):
+        load_older_messages(st.session_state['thread'])
+        st.rerun()
+
 for message in st.session_state['message_history']:
     with st.chat_message(name=message['role']):
         st.text(message['content'])
@@ -183,16 +291,20 @@ CONFIG : RunnableConfig = {
 if user_input:
     # Check if it is the first user input, if yes then find thread_name
     if st.session_state['thread']['thread_name'] is None:
-        thread_name = rename_chat_model.invoke(f"Create a brief title (3 words max) from the query given only \n{user_input}").content
+        # Start with a local placeholder so the answer streams without waiting for the title model
+        thread_name = placeholder_title(user_input)
 
         # Set thread_name 
         st.session_state['thread']['thread_name'] = thread_name
 
-        # Save to database
-        create_thread(thread_id=st.session_state['thread']['thread_id'], thread_name=thread_name,user_id= st.session_state['user_id'])
+        # Save to database, including a file uploaded before the first message
+        row = create_thread(thread_id=st.session_state['thread']['thread_id'], thread_name=thread_name,user_id= st.session_state['user_id'],file_name=st.session_state['thread']['file_name'])
+
+        # Put the new thread at the top of the cached list
+        st.session_state['thread_list'].add(row)
 
-        # Get fresh list of threads including the current thread
-        st.session_state['thread_list'] = get_threads(st.session_state['user_id'])
+        # The generated title replaces the placeholder once it arrives
+        st.session_state['title_jobs'][row['thread_id']] = submit_title_job(rename_chat_model, row['thread_id'], st.session_state['user_id'], user_input)
 
 
     # Append user_input to message_history
@@ -202,11 +314,19 @@ if user_input:
     with st.chat_message('user'):
         st.text(user_input)
     
-    stream = graph.stream(
-        {"messages": [HumanMessage(content=user_input)]},
-        config=CONFIG,
-        stream_mode="messages",
-    )
+    if ASYNC_GRAPH:
+        # astream runs on the shared event loop, iter_async hands the chunks back to this script thread
+        stream = iter_async(graph.astream(
+            {"messages": [HumanMessage(content=user_input)]},
+            config=CONFIG,
+            stream_mode="messages",
+        ))
+    else:
+        stream = graph.stream(
+            {"messages": [HumanMessage(content=user_input)]},
+            config=CONFIG,
+            stream_mode="messages",
+        )
 
     ai_message_buffer = []
     with st.status("Processing...", expanded=True) as status:
@@ -233,5 +353,9 @@ if user_input:
     # concatenate buffer to get the whole AIMessage
     ai_message = "".join(ai_message_buffer)
     # Append ai_message to message_history
+    turn = [{"role":"user","content":user_input}]
     if ai_message:
-        st.session_state['message_history'].append({'role':'assistant',"content":ai_message})
\ No newline at end of file
+        st.session_state['message_history'].append({'role':'assistant',"content":ai_message})
+        turn.append({'role':'assistant',"content":ai_message})
+    # Persist the display rows once per turn
+    save_messages(st.session_state['thread']['thread_id'], st.session_state['user_id'], turn)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import os,time,random,threading,asyncio
+from collections import deque, defaultdict
+from urllib.parse import urlsplit
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HttpClientError(RuntimeError):
+    pass
+
+
+def _backoff(attempt:int, base:float = 0.25, cap:float = 4.0) -> float:
+    # Full jitter: spreads retries from concurrent sessions instead of retrying in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Per tool latency; a bounded window of recent samples is enough for percentiles and keeps memory flat
+class LatencyRecorder:
+    def __init__(self, window:int = 512):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0})
+
+    def record(self, name:str, seconds:float, ok:bool, retries:int):
+        with self._lock:
+            self._samples[name].append(seconds * 1000)
+            counts = self._counts[name]
+            counts["requests"] += 1
+            counts["retries"] += retries
+            if not ok:
+                counts["errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                result[name] = {
+                    **self._counts[name],
+                    "p50_ms": ordered[len(ordered) // 2] if ordered else 0.0,
+                    "p95_ms": ordered[int(len(ordered) * 0.95) - 1] if ordered else 0.0,
+                    "max_ms": ordered[-1] if ordered else 0.0,
+                }
+            return result
+
+
+LATENCY = LatencyRecorder()
+
+
+# Shared, keep-alive session for every tool; one instance per process
+class HttpClient:
+    def __init__(self, connect_timeout:float = HTTP_CONNECT_TIMEOUT, read_timeout:float = HTTP_READ_TIMEOUT, max_retries:int = HTTP_MAX_RETRIES,
+                 per_host_limit:int = HTTP_PER_HOST_LIMIT, pool_size:int = HTTP_POOL_SIZE, latency:LatencyRecorder = LATENCY):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.per_host_limit = per_host_limit
+        self.latency = latency
+        self.session = requests.Session()
+        # Retries are handled below so they can be counted and jittered; the adapter only pools connections
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_limits: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url:str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_limits[host]
+
+    def get_json(self, url:str, params:dict | None = None, name:str = "http") -> dict:
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                limit = self._host_limit(url)
+                # Wait no longer than a request may take, so a stuck host cannot hold callers forever
+                if not limit.acquire(timeout=sum(self.timeout)):
+                    raise HttpClientError(f"Timed out waiting for a request slot to {urlsplit(url).netloc}")
+                try:
+                    try:
+                        response = self.session.get(url, params=params, timeout=self.timeout)
+                    finally:
+                        limit.release()
+                    if response.status_code in RETRY_STATUS:
+                        raise HttpClientError(f"Upstream returned {response.status_code}")
+                    response.raise_for_status()
+                    data = response.json()
+                    self.latency.record(name, time.perf_counter() - start, True, attempt)
+                    return data
+                except (requests.ConnectionError, requests.Timeout, HttpClientError) as e:
+                    if attempt >= self.max_retries:
+                        raise HttpClientError(f"Request to {urlsplit(url).netloc} failed after {attempt + 1} attempts; Error: {e}") from e
+                    time.sleep(_backoff(attempt))
+                    attempt += 1
+        except Exception:
+            self.latency.record(name, time.perf_counter() - start, False, attempt)
+            raise
+
+
+# Async counterpart for the async graph build; the client and semaphores are bound to the loop that first uses them
+class AsyncHttpClient:
+    def __init__(self, connect_timeout:float = HTTP_CONNECT_TIMEOUT, read_timeout:float = HTTP_READ_TIMEOUT, max_retries:int = HTTP_MAX_RETRIES,
+                 per_host_limit:int = HTTP_PER_HOST_LIMIT, pool_size:int = HTTP_POOL_SIZE, latency:LatencyRecorder = LATENCY):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.max_retries = max_retries
+        self.per_host_limit = per_host_limit
+        self.latency = latency
+        self._client: httpx.AsyncClient | None = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    def _host_limit(self, url:str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    async def get_json(self, url:str, params:dict | None = None, name:str = "http") -> dict:
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                limit = self._host_limit(url)
+                try:
+                    await asyncio.wait_for(limit.acquire(), self.timeout.connect + self.timeout.read)
+                except TimeoutError:
+                    raise HttpClientError(f"Timed out waiting for a request slot to {urlsplit(url).netloc}") from None
+                try:
+                    try:
+                        response = await self._get_client().get(url, params=params)
+                    finally:
+                        limit.release()
+                    if response.status_code in RETRY_STATUS:
+                        raise HttpClientError(f"Upstream returned {response.status_code}")
+                    response.raise_for_status()
+                    data = response.json()
+                    self.latency.record(name, time.perf_counter() - start, True, attempt)
+                    return data
+                except (httpx.TransportError, HttpClientError) as e:
+                    if attempt >= self.max_retries:
+                        raise HttpClientError(f"Request to {urlsplit(url).netloc} failed after {attempt + 1} attempts; Error: {e}") from e
+                    await asyncio.sleep(_backoff(attempt))
+                    attempt += 1
+        except Exception:
+            self.latency.record(name, time.perf_counter() - start, False, attempt)
+            raise
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+http_client = HttpClient()
+async_http_client = AsyncHttpClient()
+
+def get_http_stats() -> dict:
+    return LATENCY.stats()
@@ -0,0 +1,126 @@
+import os,time,random,threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+from metrics import EMBEDDING_SECONDS
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+
+# progress(embedded_chunks, total_chunks); total is None while the producer is still adding chunks
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+# Shared across every ingest in the process so concurrent uploads cannot open an unbounded number of requests to the endpoint
+_EXECUTOR: ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS, thread_name_prefix="embed")
+        return _EXECUTOR
+
+
+def _embed_with_retry(embeddings:Embeddings, texts:List[str], max_retries:int) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            with EMBEDDING_SECONDS.time():
+                return embeddings.embed_documents(texts)
+        except Exception:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            # Exponential backoff with full jitter so retrying batches do not hit the endpoint in lockstep
+            time.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+
+
+# FAISS indexes are not safe to search while vectors are being appended, which happens when a partially built
+# index is already published for retrieval; every read and append goes through one lock per store.
+class LockedFAISS(FAISS):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def add_embeddings(self, *args, **kwargs):
+        with self._lock:
+            return super().add_embeddings(*args, **kwargs)
+
+    def add_texts(self, *args, **kwargs):
+        with self._lock:
+            return super().add_texts(*args, **kwargs)
+
+    def similarity_search_with_score_by_vector(self, *args, **kwargs):
+        with self._lock:
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+    def max_marginal_relevance_search_with_score_by_vector(self, *args, **kwargs):
+        with self._lock:
+            return super().max_marginal_relevance_search_with_score_by_vector(*args, **kwargs)
+
+
+# Embeds chunks in batches on the shared pool and grows a FAISS index as batches complete.
+# All index mutation and progress callbacks happen on the caller's thread, which Streamlit requires for UI updates.
+class EmbeddingPipeline:
+    def __init__(self, embeddings:Embeddings, batch_size:int = EMBEDDING_BATCH_SIZE, max_in_flight:int = EMBEDDING_MAX_WORKERS,
+                 max_retries:int = EMBEDDING_MAX_RETRIES, on_progress:Optional[ProgressCallback] = None, total:Optional[int] = None):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.on_progress = on_progress
+        self.total = total
+        self.vector_store: LockedFAISS | None = None
+        self._pending: dict[Future, List[Document]] = {}
+        self._submitted = 0
+        self._embedded = 0
+
+    def add_documents(self, chunks:List[Document]):
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            # Bound the work queued per ingest; wait for a slot before submitting more
+            while len(self._pending) >= self.max_in_flight:
+                self._drain()
+            future = _get_executor().submit(_embed_with_retry, self.embeddings, [d.page_content for d in batch], self.max_retries)
+            self._pending[future] = batch
+            self._submitted += len(batch)
+
+    def _drain(self):
+        done, _ = wait(list(self._pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            batch = self._pending.pop(future)
+            try:
+                vectors = future.result() # Re-raises once retries are exhausted
+            except Exception:
+                self._abort()
+                raise
+            self._add_to_index(batch, vectors)
+            self._embedded += len(batch)
+            if self.on_progress:
+                self.on_progress(self._embedded, self.total)
+
+    def _abort(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    def _add_to_index(self, batch:List[Document], vectors:List[List[float]]):
+        text_embeddings = [(d.page_content, v) for d, v in zip(batch, vectors)]
+        metadatas = [d.metadata for d in batch]
+        if self.vector_store is None:
+            self.vector_store = LockedFAISS.from_embeddings(text_embeddings=text_embeddings, embedding=self.embeddings, metadatas=metadatas)
+        else:
+            self.vector_store.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas)
+
+    def finish(self) -> LockedFAISS:
+        # Everything has been submitted, so the total is known from here on
+        self.total = self._submitted
+        while self._pending:
+            self._drain()
+        if self.vector_store is None:
+            raise ValueError("No text could be extracted from the document")
+        return self.vector_store
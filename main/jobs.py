@@ -0,0 +1,67 @@
+import os,uuid,time,threading,logging
+from concurrent.futures import ThreadPoolExecutor
+from database_utils import create_job,update_job,get_job,get_active_job
+from RAG import ingest_pdf
+
+logger = logging.getLogger(__name__)
+
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+PROGRESS_UPDATE_INTERVAL = 1.0 # seconds between progress writes to the jobs table
+
+# Ingestion runs here instead of the Streamlit script thread; the worker count bounds how many uploads parse and embed at once
+_EXECUTOR = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest")
+
+# (user_id, thread_id, doc_type) -> job_id for jobs running in this process; avoids a database read on every retrieval
+_ACTIVE_JOBS: dict[tuple, uuid.UUID] = {}
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _run_ingest_job(job_id:uuid.UUID, thread_id:uuid.UUID, user_id:uuid.UUID, file_bytes:bytes, file_name:str | None):
+    key = (user_id, thread_id, "pdf")
+    last_update = 0.0
+
+    def report_progress(embedded, total):
+        nonlocal last_update
+        now = time.monotonic()
+        if total is None and now - last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update = now
+        try:
+            update_job(job_id, embedded_chunks=embedded, total_chunks=total)
+        except RuntimeError as e:
+            logger.warning(f"Could not record progress for job {job_id}; Error: {e}")
+
+    try:
+        update_job(job_id, status="running")
+        ingest_pdf(file_bytes=file_bytes, thread_id=thread_id, user_id=user_id, on_progress=report_progress, file_name=file_name)
+        update_job(job_id, status="done")
+    except Exception as e:
+        logger.exception(f"Ingestion job {job_id} failed")
+        update_job(job_id, status="failed", error=str(e))
+    finally:
+        with _ACTIVE_LOCK:
+            if _ACTIVE_JOBS.get(key) == job_id:
+                del _ACTIVE_JOBS[key]
+
+
+def submit_ingest_job(thread_id:uuid.UUID, user_id:uuid.UUID, file_bytes:bytes, file_name:str | None = None) -> uuid.UUID:
+    job_id = uuid.uuid4()
+    create_job(job_id, thread_id, user_id, "pdf", file_name)
+    with _ACTIVE_LOCK:
+        _ACTIVE_JOBS[(user_id, thread_id, "pdf")] = job_id
+    _EXECUTOR.submit(_run_ingest_job, job_id, thread_id, user_id, file_bytes, file_name)
+    return job_id
+
+
+def get_job_status(job_id:uuid.UUID):
+    return get_job(job_id)
+
+
+def is_indexing(thread_id:uuid.UUID, user_id:uuid.UUID, doc_type:str = "pdf", local_only:bool = False) -> bool:
+    with _ACTIVE_LOCK:
+        if (user_id, thread_id, doc_type) in _ACTIVE_JOBS:
+            return True
+    if local_only:
+        return False
+    # The job may be running on another replica
+    return get_active_job(thread_id, user_id, doc_type) is not None
@@ -0,0 +1,277 @@
+import os,time,random,threading,asyncio,itertools,logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from langchain_core.messages import BaseMessage
+from http_client import LatencyRecorder
+from context_window import estimate_tokens
+from metrics import LLM_SECONDS,record_usage
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "512")) # Expected completion size, corrected from usage afterwards
+LLM_FALLBACK_QUEUE_DEPTH = int(os.getenv("LLM_FALLBACK_QUEUE_DEPTH", "0")) # Route to the fallback model at this queue depth; 0 disables
+LLM_MAX_BACKOFF = 60.0
+
+
+@dataclass(frozen=True)
+class ModelLimits:
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# Groq free tier limits; override per deployment with LLM_RPM / LLM_TPM
+DEFAULT_LIMITS: dict[str, ModelLimits] = {
+    "openai/gpt-oss-120b": ModelLimits(float(os.getenv("LLM_RPM", "30")), float(os.getenv("LLM_TPM", "8000"))),
+    "openai/gpt-oss-20b": ModelLimits(float(os.getenv("LLM_RPM", "30")), float(os.getenv("LLM_TPM", "8000"))),
+}
+
+
+class TokenBucket:
+    # Refills continuously at per_minute / 60 per second up to one minute's worth; callers hold the scheduler lock
+    def __init__(self, per_minute:float, clock:Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount:float) -> float:
+        self._refill()
+        # A request larger than the bucket could never run; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount:float):
+        # May go negative when usage is corrected upwards; later callers then wait for the debt
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass
+class _ModelState:
+    requests: TokenBucket
+    tokens: TokenBucket
+    queue: deque = field(default_factory=deque)
+    cooldown_until: float = 0.0
+    backoff: float = 0.0
+    max_queue_depth: int = 0
+    rate_limited: int = 0
+    fallbacks: int = 0
+    tokens_used: int = 0
+
+
+def _is_rate_limit(error:Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error:Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def estimate_prompt_tokens(input:Any) -> int:
+    if isinstance(input, str):
+        return len(input) // 4
+    if hasattr(input, "to_messages"): # PromptValue
+        input = input.to_messages()
+    if isinstance(input, list):
+        return sum(estimate_tokens(m) if isinstance(m, BaseMessage) else len(str(m)) // 4 for m in input)
+    return len(str(input)) // 4
+
+
+# One scheduler per process in front of every model call. Callers queue per model in arrival order, and only the head
+# of a queue may take request and token budget, so a burst from one session cannot starve the others.
+class LLMScheduler:
+    def __init__(self, limits:dict[str, ModelLimits] = DEFAULT_LIMITS, max_retries:int = LLM_MAX_RETRIES, completion_tokens:int = LLM_COMPLETION_TOKENS,
+                 fallback_queue_depth:int = LLM_FALLBACK_QUEUE_DEPTH, clock:Callable[[], float] = time.monotonic):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.completion_tokens = completion_tokens
+        self.fallback_queue_depth = fallback_queue_depth
+        self._clock = clock
+        self._models: dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._tickets = itertools.count()
+        self.waits = LatencyRecorder()
+
+    def _state(self, name:str) -> _ModelState:
+        if name not in self._models:
+            limits = self.limits.get(name) or next(iter(self.limits.values()))
+            self._models[name] = _ModelState(TokenBucket(limits.requests_per_minute, self._clock), TokenBucket(limits.tokens_per_minute, self._clock))
+        return self._models[name]
+
+    def _enqueue(self, name:str) -> int:
+        with self._lock:
+            state = self._state(name)
+            ticket = next(self._tickets)
+            state.queue.append(ticket)
+            state.max_queue_depth = max(state.max_queue_depth, len(state.queue))
+            return ticket
+
+    def _leave(self, name:str, ticket:int):
+        with self._lock:
+            queue = self._state(name).queue
+            if ticket in queue:
+                queue.remove(ticket)
+                self._cond.notify_all()
+
+    def _poll(self, name:str, ticket:int, tokens:int) -> float:
+        # 0 means the ticket was granted and left the queue; otherwise the seconds worth waiting before asking again
+        with self._lock:
+            state = self._state(name)
+            if state.queue[0] != ticket:
+                return 0.05
+            wait = max(state.cooldown_until - self._clock(), state.requests.wait_time(1), state.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            state.requests.consume(1)
+            state.tokens.consume(tokens)
+            state.queue.popleft()
+            self._cond.notify_all()
+            return 0.0
+
+    def acquire(self, name:str, tokens:int):
+        ticket = self._enqueue(name)
+        start = self._clock()
+        try:
+            while (wait := self._poll(name, ticket, tokens)) > 0:
+                with self._cond:
+                    self._cond.wait(min(wait, 1.0))
+        except BaseException:
+            self._leave(name, ticket)
+            raise
+        self.waits.record(name, self._clock() - start, True, 0)
+
+    async def aacquire(self, name:str, tokens:int):
+        ticket = self._enqueue(name)
+        start = self._clock()
+        try:
+            while (wait := self._poll(name, ticket, tokens)) > 0:
+                await asyncio.sleep(min(wait, 0.25))
+        except BaseException: # Includes cancellation of the graph run
+            self._leave(name, ticket)
+            raise
+        self.waits.record(name, self._clock() - start, True, 0)
+
+    def route(self, name:str, fallback:Optional[str]) -> str:
+        # Deep queue on the primary model: send the call to the smaller model if it is less busy
+        if not fallback or not self.fallback_queue_depth:
+            return name
+        with self._lock:
+            state, other = self._state(name), self._state(fallback)
+            if len(state.queue) >= self.fallback_queue_depth and len(other.queue) < len(state.queue):
+                state.fallbacks += 1
+                return fallback
+            return name
+
+    def rate_limited(self, name:str, error:Exception):
+        # Adaptive backoff: every 429 doubles the pause for the whole model, a success resets it
+        with self._lock:
+            state = self._state(name)
+            state.rate_limited += 1
+            state.backoff = min(LLM_MAX_BACKOFF, max(1.0, state.backoff * 2))
+            pause = _retry_after(error) or random.uniform(state.backoff / 2, state.backoff)
+            state.cooldown_until = max(state.cooldown_until, self._clock() + pause)
+        logger.warning(f"{name} rate limited; pausing {pause:.1f}s")
+
+    def settle(self, name:str, estimated:int, result:Any):
+        # Replace the estimate with the reported usage so the bucket tracks what the provider counts
+        usage = getattr(result, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens", estimated)
+        with self._lock:
+            state = self._state(name)
+            state.tokens.consume(actual - estimated)
+            state.tokens_used += actual
+            state.backoff = 0.0
+
+    def invoke(self, models:dict[str, Any], name:str, input:Any, config=None, fallback:Optional[str] = None, **kwargs):
+        name = self.route(name, fallback)
+        tokens = estimate_prompt_tokens(input) + self.completion_tokens
+        attempt = 0
+        while True:
+            self.acquire(name, tokens)
+            try:
+                with LLM_SECONDS.time(model=name):
+                    result = models[name].invoke(input, config, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt >= self.max_retries:
+                    raise
+                self.rate_limited(name, e)
+                attempt += 1
+                continue
+            self.settle(name, tokens, result)
+            record_usage(name, result)
+            return result
+
+    async def ainvoke(self, models:dict[str, Any], name:str, input:Any, config=None, fallback:Optional[str] = None, **kwargs):
+        name = self.route(name, fallback)
+        tokens = estimate_prompt_tokens(input) + self.completion_tokens
+        attempt = 0
+        while True:
+            await self.aacquire(name, tokens)
+            try:
+                with LLM_SECONDS.time(model=name):
+                    result = await models[name].ainvoke(input, config, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt >= self.max_retries:
+                    raise
+                self.rate_limited(name, e)
+                attempt += 1
+                continue
+            self.settle(name, tokens, result)
+            record_usage(name, result)
+            return result
+
+    def stats(self) -> dict:
+        waits = self.waits.stats()
+        with self._lock:
+            now = self._clock()
+            return {
+                name: {
+                    "queue_depth": len(state.queue),
+                    "max_queue_depth": state.max_queue_depth,
+                    "rate_limited": state.rate_limited,
+                    "fallbacks": state.fallbacks,
+                    "tokens_used": state.tokens_used,
+                    "cooldown_seconds": max(0.0, state.cooldown_until - now),
+                    "wait": waits.get(name, {}),
+                }
+                for name, state in self._models.items()
+            }
+
+
+# Drop-in for a chat model: same invoke/ainvoke/bind_tools, every call goes through the scheduler.
+# Works with any runnable, so a fake chat model can stand in for Groq.
+class ScheduledModel:
+    def __init__(self, scheduler:LLMScheduler, name:str, model:Any, fallback_name:Optional[str] = None, fallback:Any = None):
+        self.scheduler = scheduler
+        self.name = name
+        self.fallback_name = fallback_name if fallback is not None else None
+        self._models = {name: model, **({fallback_name: fallback} if self.fallback_name else {})}
+
+    def bind_tools(self, tools, **kwargs) -> "ScheduledModel":
+        fallback = self._models[self.fallback_name].bind_tools(tools, **kwargs) if self.fallback_name else None
+        return ScheduledModel(self.scheduler, self.name, self._models[self.name].bind_tools(tools, **kwargs), self.fallback_name, fallback)
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.scheduler.invoke(self._models, self.name, input, config, fallback=self.fallback_name, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.scheduler.ainvoke(self._models, self.name, input, config, fallback=self.fallback_name, **kwargs)
+
+
+llm_scheduler = LLMScheduler()
+
+def get_llm_stats() -> dict:
+    return llm_scheduler.stats()
@@ -0,0 +1,265 @@
+import os,re,time,bisect,inspect,threading,functools,logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "phoenix"
+# Seconds; covers a cached tool hit (~1 ms) up to a slow multi tool LLM turn
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels_text(labels:tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+# Metrics are cheap enough to stay on in production: one short lock per observation, no allocation beyond the first
+# use of a label set.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name:str, help:str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount:float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str, buckets:tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {} # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        result = []
+        with self._lock:
+            for key, row in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                    cumulative += count
+                    result.append((f"{self.name}_bucket", key + (("le", "+Inf" if bound == float("inf") else repr(bound)),), cumulative))
+                result.append((f"{self.name}_count", key, cumulative))
+                result.append((f"{self.name}_sum", key, row[-1]))
+        return result
+
+    def summary(self) -> list[dict]:
+        # Count, mean and bucket-bound percentiles per label set, for the admin panel
+        result = []
+        with self._lock:
+            for key, row in self._values.items():
+                counts, total = row[:-1], sum(row[:-1])
+                if not total:
+                    continue
+                def percentile(q:float) -> float:
+                    running = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), counts):
+                        running += count
+                        if running >= q * total:
+                            return bound
+                    return float("inf")
+                result.append({"metric": self.name, "labels": dict(key), "count": total, "mean_ms": row[-1] / total * 1000,
+                               "p50_ms": percentile(0.5) * 1000, "p95_ms": percentile(0.95) * 1000})
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self, prefix:str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name:str, help:str, **kwargs):
+        name = f"{self.prefix}_{name}"
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name:str, help:str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name:str, help:str = "", buckets:tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def register_collector(self, name:str, collect:Callable[[], dict]):
+        # stats() of caches, pools and schedulers; numeric leaves are exported as gauges when scraped
+        with self._lock:
+            self._collectors[name] = collect
+
+    def _collected(self) -> list[tuple[str, tuple, float]]:
+        samples = []
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collect in collectors:
+            try:
+                data = collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed; Error: {e}")
+                continue
+            self._flatten(f"{self.prefix}_{name}", data, (), samples)
+        return samples
+
+    def _flatten(self, prefix:str, data, path:tuple, samples:list):
+        # Leaf name becomes part of the metric name, the keys above it a label: llm.<model>.queue_depth ->
+        # phoenix_llm_queue_depth{key="<model>"}
+        if isinstance(data, dict):
+            for key, value in data.items():
+                self._flatten(prefix, value, path + (str(key),), samples)
+        elif isinstance(data, list):
+            for i, value in enumerate(data):
+                self._flatten(prefix, value, path + (str(i),), samples)
+        elif isinstance(data, (int, float)): # bools export as 0/1
+            name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{path[-1]}" if path else prefix)
+            labels = (("key", ".".join(path[:-1])),) if len(path) > 1 else ()
+            samples.append((name, labels, float(data)))
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{_labels_text(labels)} {value}" for name, labels, value in metric.samples())
+        for name, labels, value in self._collected():
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            "histograms": [row for m in metrics if isinstance(m, Histogram) for row in m.summary()],
+            "counters": [{"metric": name, "labels": dict(labels), "value": value} for m in metrics if isinstance(m, Counter) for name, labels, value in m.samples()],
+        }
+
+    def collect(self) -> dict:
+        with self._lock:
+            collectors = list(self._collectors.items())
+        result = {}
+        for name, collect in collectors:
+            try:
+                result[name] = collect()
+            except Exception as e:
+                result[name] = {"error": str(e)}
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+# Shared metrics; label values stay low cardinality (node, tool, model, doc_type names)
+NODE_SECONDS = REGISTRY.histogram("node_seconds", "Graph node latency")
+LLM_SECONDS = REGISTRY.histogram("llm_seconds", "Model call latency, excluding scheduler queueing")
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by the model")
+TOOL_SECONDS = REGISTRY.histogram("tool_seconds", "Tool call latency, including tool cache hits")
+TOOL_CALLS = REGISTRY.counter("tool_calls_total", "Tool calls by outcome")
+RETRIEVER_SECONDS = REGISTRY.histogram("retriever_seconds", "get_retriever latency by source")
+EMBEDDING_SECONDS = REGISTRY.histogram("embedding_seconds", "Embedding batch latency")
+INDEX_BUILD_SECONDS = REGISTRY.histogram("index_build_seconds", "Vector store build latency", buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+CHECKPOINT_SECONDS = REGISTRY.histogram("checkpoint_seconds", "Checkpoint read and write latency")
+
+
+def timed(histogram:Histogram, **labels):
+    # Decorator for sync and async functions
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(model:str, result):
+    usage = getattr(result, "usage_metadata", None) or {}
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], model=model, type=kind.removesuffix("_tokens"))
+
+
+def instrument_checkpointer(checkpointer):
+    # Wraps the saver's read and write methods on the instance; the graph calls them through the instance
+    # list/alist are generators used for history, not on the request path, and are left alone
+    for name, operation in (("get_tuple", "read"), ("put", "write"), ("put_writes", "write_pending"),
+                            ("aget_tuple", "read"), ("aput", "write"), ("aput_writes", "write_pending")):
+        method = getattr(checkpointer, name, None)
+        if method is not None:
+            setattr(checkpointer, name, timed(CHECKPOINT_SECONDS, operation=operation)(method))
+    return checkpointer
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would flood the Streamlit log
+
+
+_SERVER: ThreadingHTTPServer | None = None
+_SERVER_LOCK = threading.Lock()
+
+def start_metrics_server(port:int, host:str | None = None) -> ThreadingHTTPServer:
+    # Once per process, on a daemon thread next to Streamlit. The endpoint has no authentication, so it only listens on
+    # loopback unless METRICS_HOST says otherwise
+    global _SERVER
+    host = host or os.getenv("METRICS_HOST") or "127.0.0.1"
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            _SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_SERVER.serve_forever, name="metrics", daemon=True).start()
+            logger.info(f"Serving metrics on {host}:{port}/metrics")
+        return _SERVER
@@ -0,0 +1,128 @@
+import os,time,threading,logging
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+POOL_KEEPALIVE_SECONDS = float(os.getenv("POOL_KEEPALIVE_SECONDS", "240")) # Below Neon's default 5 minute suspend; 0 disables
+POOL_WARMUP_TIMEOUT = float(os.getenv("POOL_WARMUP_TIMEOUT", "30"))
+POOL_MAX_CEILING = int(os.getenv("POOL_MAX_CEILING", "20"))
+
+
+# Warm-up, keep-alive, health and sizing for the shared ConnectionPool. Neon scales compute to zero when idle,
+# so the first query after a quiet period otherwise pays the wake-up inside a user's turn.
+class PoolManager:
+    def __init__(self, pool:ConnectionPool, keepalive_seconds:float = POOL_KEEPALIVE_SECONDS, max_ceiling:int = POOL_MAX_CEILING):
+        self.pool = pool
+        self.keepalive_seconds = keepalive_seconds
+        self.max_ceiling = max(max_ceiling, pool.max_size)
+        self.base_min_size = pool.min_size
+        self.base_max_size = pool.max_size
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_wait_ms = 0
+        self._last_requests = 0
+        self.health = {"healthy": None, "last_check": None, "last_latency_ms": None, "consecutive_failures": 0, "warmup_ms": None, "resizes": 0}
+
+    def warm_up(self, timeout:float = POOL_WARMUP_TIMEOUT):
+        # Block until min_size connections exist and one round trip succeeded, waking the compute before users arrive
+        start = time.perf_counter()
+        self.pool.wait(timeout=timeout)
+        self.check_health()
+        with self._lock:
+            self.health["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def check_health(self) -> bool:
+        start = time.perf_counter()
+        try:
+            with self.pool.connection(timeout=10) as conn:
+                conn.execute("SELECT 1")
+            ok = True
+        except Exception as e:
+            logger.warning(f"Database health check failed; Error: {e}")
+            ok = False
+        # Discard connections the server closed while idle, so user requests do not hit them first
+        try:
+            self.pool.check()
+        except Exception as e:
+            logger.warning(f"Pool check failed; Error: {e}")
+        with self._lock:
+            self.health["healthy"] = ok
+            self.health["last_check"] = time.time()
+            self.health["last_latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            self.health["consecutive_failures"] = 0 if ok else self.health["consecutive_failures"] + 1
+        return ok
+
+    def tune(self):
+        """
+        Size the pool from what was observed since the last call: grow max_size while requests had to wait for a
+        connection, raise min_size towards the connections actually in use, and relax both back when traffic drops.
+        """
+        stats = self.pool.get_stats()
+        wait_ms = stats.get("requests_wait_ms", 0)
+        requests = stats.get("requests_num", 0)
+        waited = wait_ms - self._last_wait_ms
+        new_requests = requests - self._last_requests
+        self._last_wait_ms, self._last_requests = wait_ms, requests
+
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        min_size, max_size = self.pool.min_size, self.pool.max_size
+        if waited > 0 or stats.get("requests_waiting", 0) > 0:
+            max_size = min(self.max_ceiling, max_size + 2)
+        elif new_requests == 0:
+            max_size = max(self.base_max_size, max_size - 1)
+        min_size = min(max_size, max(self.base_min_size, in_use))
+
+        if (min_size, max_size) != (self.pool.min_size, self.pool.max_size):
+            self.pool.resize(min_size=min_size, max_size=max_size)
+            with self._lock:
+                self.health["resizes"] += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.keepalive_seconds):
+            self.check_health()
+            try:
+                self.tune()
+            except Exception as e:
+                logger.warning(f"Pool tuning failed; Error: {e}")
+
+    def start(self, warm:bool = True):
+        if warm:
+            try:
+                self.warm_up()
+            except Exception as e:
+                # Startup must not fail because the database is still waking up; requests will retry on their own
+                logger.warning(f"Pool warm-up did not complete; Error: {e}")
+        if self.keepalive_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="pool-keepalive", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        pool_stats = self.pool.get_stats()
+        requests = pool_stats.get("requests_num", 0)
+        with self._lock:
+            health = dict(self.health)
+        return {
+            **pool_stats,
+            "pool_min": self.pool.min_size,
+            "pool_max": self.pool.max_size,
+            "avg_wait_ms": pool_stats.get("requests_wait_ms", 0) / requests if requests else 0.0,
+            "avg_usage_ms": pool_stats.get("usage_ms", 0) / requests if requests else 0.0,
+            **health,
+        }
+
+
+_MANAGER: PoolManager | None = None
+
+def start_pool_manager(pool:ConnectionPool, warm:bool = True) -> PoolManager:
+    global _MANAGER
+    if _MANAGER is None:
+        _MANAGER = PoolManager(pool)
+        _MANAGER.start(warm=warm)
+    return _MANAGER
+
+def get_pool_stats() -> dict:
+    return _MANAGER.stats() if _MANAGER is not None else {}
@@ -0,0 +1,151 @@
+import os,time,argparse,threading,logging
+from database_utils import get_conn
+
+logger = logging.getLogger(__name__)
+
+RETENTION_KEEP = int(os.getenv("RETENTION_KEEP", "20"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_LOCK_ID = 727_001 # pg advisory lock, one retention run across all replicas
+
+# Every super-step of every turn adds a checkpoint; only the newest `keep` per thread are needed to resume or inspect a thread.
+# The cutoff of each thread (its newest checkpoint past `keep`) is found once per run by walking the primary key from the
+# newest end; checkpoint ids grow over time, so checkpoints written during the run always sort above it.
+CHECKPOINT_CUTOFFS = """
+    SELECT t.thread_id, t.checkpoint_ns, c.checkpoint_id AS cutoff
+    FROM (SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints) t
+    CROSS JOIN LATERAL (
+        SELECT checkpoint_id FROM checkpoints c
+        WHERE c.thread_id = t.thread_id AND c.checkpoint_ns = t.checkpoint_ns
+        ORDER BY checkpoint_id DESC
+        OFFSET %(keep)s LIMIT 1
+    ) c
+"""
+
+DELETE_OLD_CHECKPOINTS = """
+    WITH doomed AS (
+        SELECT ctid FROM checkpoints
+        WHERE thread_id = %(thread_id)s AND checkpoint_ns = %(checkpoint_ns)s AND checkpoint_id <= %(cutoff)s
+        LIMIT %(batch)s
+    ), deleted AS (
+        DELETE FROM checkpoints c USING doomed d WHERE c.ctid = d.ctid
+        RETURNING pg_column_size(c.checkpoint) + pg_column_size(c.metadata) AS bytes
+    )
+    SELECT count(*) AS rows, COALESCE(sum(bytes), 0) AS bytes FROM deleted
+"""
+
+# Pending writes belong to a single checkpoint and are useless once it is gone
+DELETE_ORPHAN_WRITES = """
+    WITH doomed AS (
+        SELECT w.ctid FROM checkpoint_writes w
+        WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c
+            WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns AND c.checkpoint_id = w.checkpoint_id
+        )
+        LIMIT %(batch)s
+    ), deleted AS (
+        DELETE FROM checkpoint_writes w USING doomed d WHERE w.ctid = d.ctid
+        RETURNING COALESCE(octet_length(w.blob), 0) AS bytes
+    )
+    SELECT count(*) AS rows, COALESCE(sum(bytes), 0) AS bytes FROM deleted
+"""
+
+# A blob is a channel value at one version. Delete it only when no checkpoint references it and a newer version of the
+# channel exists, so blobs written by a checkpoint that is still being committed are never touched.
+DELETE_ORPHAN_BLOBS = """
+    WITH doomed AS (
+        SELECT b.ctid FROM checkpoint_blobs b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c
+            WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+              AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+        )
+        AND EXISTS (
+            SELECT 1 FROM checkpoints c
+            WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+              AND c.checkpoint -> 'channel_versions' ->> b.channel > b.version
+        )
+        LIMIT %(batch)s
+    ), deleted AS (
+        DELETE FROM checkpoint_blobs b USING doomed d WHERE b.ctid = d.ctid
+        RETURNING COALESCE(octet_length(b.blob), 0) AS bytes
+    )
+    SELECT count(*) AS rows, COALESCE(sum(bytes), 0) AS bytes FROM deleted
+"""
+
+
+def _delete_in_batches(cur, sql:str, params:dict) -> tuple[int, int]:
+    rows = reclaimed = 0
+    while True:
+        # Autocommit: each batch is its own short transaction, so locks are held briefly
+        cur.execute(sql, params)
+        result = cur.fetchone()
+        rows += result['rows']
+        reclaimed += int(result['bytes'])
+        if result['rows'] < params['batch']:
+            return rows, reclaimed
+
+
+def _delete_old_checkpoints(cur, params:dict) -> tuple[int, int]:
+    cur.execute(CHECKPOINT_CUTOFFS, params)
+    rows = reclaimed = 0
+    for cutoff in cur.fetchall():
+        deleted, freed = _delete_in_batches(cur, DELETE_OLD_CHECKPOINTS, {**params, **cutoff})
+        rows += deleted
+        reclaimed += freed
+    return rows, reclaimed
+
+
+def run_retention(keep:int = RETENTION_KEEP, batch_size:int = RETENTION_BATCH_SIZE) -> dict:
+    if keep < 1:
+        raise ValueError("keep must be at least 1, the latest checkpoint is needed to resume a thread")
+    params = {"keep": keep, "batch": batch_size}
+    report = {"skipped": False, "checkpoints": 0, "writes": 0, "blobs": 0, "indexes": 0, "bytes_reclaimed": 0}
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s) AS locked", (RETENTION_LOCK_ID,))
+                if not cur.fetchone()['locked']:
+                    report["skipped"] = True # Another replica is compacting
+                    return report
+                try:
+                    start = time.perf_counter()
+                    report["checkpoints"], report["bytes_reclaimed"] = _delete_old_checkpoints(cur, params)
+                    for name, sql in (("writes", DELETE_ORPHAN_WRITES), ("blobs", DELETE_ORPHAN_BLOBS)):
+                        rows, reclaimed = _delete_in_batches(cur, sql, params)
+                        report[name] = rows
+                        report["bytes_reclaimed"] += reclaimed
+                    # Vector indexes of deleted threads; imported here so the checkpoint queries do not load the RAG stack
+                    from RAG import gc_vector_indexes
+                    report["indexes"] = gc_vector_indexes()
+                    report["seconds"] = round(time.perf_counter() - start, 3)
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (RETENTION_LOCK_ID,))
+        return report
+    except Exception as e:
+        raise RuntimeError(f"Runtime Error on checkpoint retention; Error: {e}") from e
+
+
+def start_retention_task(interval_seconds:float, keep:int = RETENTION_KEEP, batch_size:int = RETENTION_BATCH_SIZE) -> threading.Thread:
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                logger.info(f"Checkpoint retention: {run_retention(keep, batch_size)}")
+            except RuntimeError as e:
+                logger.warning(str(e))
+
+    thread = threading.Thread(target=loop, name="checkpoint-retention", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact LangGraph checkpoints: keep the latest K per thread, delete orphaned writes and blobs and vector indexes no thread uses")
+    parser.add_argument("--keep", type=int, default=RETENTION_KEEP, help="checkpoints to keep per thread")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE, help="rows deleted per statement")
+    args = parser.parse_args()
+    report = run_retention(keep=args.keep, batch_size=args.batch_size)
+    if report["skipped"]:
+        print("Another retention run holds the lock, nothing done")
+    else:
+        print(f"Deleted {report['checkpoints']} checkpoints, {report['writes']} writes, {report['blobs']} blobs, {report['indexes']} vector indexes; reclaimed {report['bytes_reclaimed'] / 1024:.1f} KiB in {report['seconds']}s")
@@ -0,0 +1,80 @@
+import os
+from contextlib import nullcontext
+from typing import Literal
+import numpy as np
+from embedding_cache import vector_cache
+from RAG import get_retriever,get_embedding_model
+
+RETRIEVAL_K = 5
+# Maximal marginal relevance trades a little similarity for chunks that do not repeat each other
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "false").lower() == "true"
+RETRIEVAL_MMR_FETCH_K = int(os.getenv("RETRIEVAL_MMR_FETCH_K", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+
+# ("query", model, normalised query) -> vector. Sits in front of the shared embedding cache so a repeated question costs
+# neither an HTTP call nor a database lookup, only the local FAISS search
+_QUERY_VECTORS = vector_cache(float(os.getenv("QUERY_CACHE_MAX_MB", "8")), max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096")))
+
+def normalize_query(query:str) -> str:
+    return " ".join(query.lower().split())
+
+def embed_queries(queries:list[str]) -> list[list[float]]:
+    embeddings = get_embedding_model()
+    # The normalised form is only the cache key; the model sees the query as the user wrote it
+    keys = [("query", embeddings.model_name, normalize_query(q)) for q in queries]
+    vectors = {key: _QUERY_VECTORS.get(key) for key in keys}
+    missing = {}
+    for key, query in zip(keys, queries):
+        if vectors[key] is None:
+            missing.setdefault(key, query)
+    for key, query in missing.items():
+        vectors[key] = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        _QUERY_VECTORS.set(key, vectors[key])
+    return [vectors[key].tolist() for key in keys]
+
+def _vector_store(thread_id, user_id, doc_type):
+    retriever = get_retriever(thread_id, user_id, doc_type=doc_type)
+    return retriever.vectorstore if retriever else None
+
+def _search_many(vector_store, vectors:list[list[float]], k:int) -> list[list]:
+    if hasattr(vector_store, "search_by_vectors"): # pgvector: one query for the whole batch
+        return vector_store.search_by_vectors(vectors, k)
+    # One FAISS call for the whole batch; partially built indexes carry a lock that guards concurrent appends
+    matrix = np.asarray(vectors, dtype=np.float32)
+    with getattr(vector_store, "_lock", None) or nullcontext():
+        if getattr(vector_store, "_normalize_L2", False):
+            import faiss
+            faiss.normalize_L2(matrix)
+        _, ids = vector_store.index.search(matrix, k)
+        results = []
+        for row in ids:
+            docs = []
+            for i in row:
+                if i == -1:
+                    continue
+                doc = vector_store.docstore.search(vector_store.index_to_docstore_id[int(i)])
+                if not isinstance(doc, str): # docstore returns an error string for unknown ids
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+def search(thread_id, user_id, doc_type: Literal["YTvideo", "pdf"], query:str, k:int = RETRIEVAL_K, mmr:bool = RETRIEVAL_MMR):
+    # Returns None when the thread has no index, like get_retriever
+    if not mmr:
+        results = batch_search(thread_id, user_id, doc_type, [query], k)
+        return results[0] if results is not None else None
+    vector_store = _vector_store(thread_id, user_id, doc_type)
+    if vector_store is None:
+        return None
+    return vector_store.max_marginal_relevance_search_by_vector(embed_queries([query])[0], k=k, fetch_k=max(k, RETRIEVAL_MMR_FETCH_K), lambda_mult=RETRIEVAL_MMR_LAMBDA)
+
+def batch_search(thread_id, user_id, doc_type: Literal["YTvideo", "pdf"], queries:list[str], k:int = RETRIEVAL_K):
+    vector_store = _vector_store(thread_id, user_id, doc_type)
+    if vector_store is None:
+        return None
+    if not queries:
+        return []
+    return _search_many(vector_store, embed_queries(queries), k)
+
+def get_query_cache_stats() -> dict:
+    return _QUERY_VECTORS.stats()
@@ -0,0 +1,35 @@
+import uuid
+from database_utils import get_threads_page
+
+# Per-session sidebar list. Pages are fetched on demand and local changes (new thread, file name, title) are applied
+# in place instead of refetching the whole list.
+class ThreadListCache:
+    def __init__(self, user_id:uuid.UUID, page_size:int = 30):
+        self.user_id = user_id
+        self.page_size = page_size
+        self.items: list[dict] = []
+        self.has_more = True
+        self._cursor = None
+        self.load_more()
+
+    def load_more(self):
+        if not self.has_more:
+            return
+        # Fetch one extra row to know whether another page exists
+        rows = get_threads_page(self.user_id, limit=self.page_size + 1, cursor=self._cursor)
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        known = {item['thread_id'] for item in self.items}
+        self.items.extend(row for row in rows if row['thread_id'] not in known)
+        if rows:
+            self._cursor = (rows[-1]['created_at'], rows[-1]['thread_id'])
+
+    def add(self, thread:dict):
+        # Newest thread goes first, matching ORDER BY created_at DESC
+        self.items = [thread] + [item for item in self.items if item['thread_id'] != thread['thread_id']]
+
+    def update(self, thread_id:uuid.UUID, **fields):
+        for item in self.items:
+            if item['thread_id'] == thread_id:
+                item.update(fields)
+                return
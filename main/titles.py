@@ -0,0 +1,38 @@
+import os,uuid,logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from database_utils import update_thread_name
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_WORKERS = int(os.getenv("TITLE_MAX_WORKERS", "2"))
+PLACEHOLDER_MAX_CHARS = 40
+
+# Titles are generated off the Streamlit script thread so the first answer of a chat does not wait for a second LLM call
+_EXECUTOR = ThreadPoolExecutor(max_workers=TITLE_MAX_WORKERS, thread_name_prefix="title")
+
+
+def placeholder_title(user_input:str) -> str:
+    # Shown in the sidebar until the generated title arrives
+    text = " ".join(user_input.split())
+    if len(text) <= PLACEHOLDER_MAX_CHARS:
+        return text or "New chat"
+    return text[:PLACEHOLDER_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+
+
+def _generate_title(model, thread_id:uuid.UUID, user_id:uuid.UUID, user_input:str) -> str | None:
+    try:
+        title = model.invoke(f"Create a brief title (3 words max) from the query given only \n{user_input}").content
+        title = title.strip().strip('"\'').strip()
+        if not title:
+            return None
+        update_thread_name(title, thread_id=thread_id, user_id=user_id)
+        return title
+    except Exception:
+        # The placeholder stays; a missing title is not worth failing the chat over
+        logger.exception(f"Title generation failed for thread {thread_id}")
+        return None
+
+
+def submit_title_job(model, thread_id:uuid.UUID, user_id:uuid.UUID, user_input:str) -> Future:
+    # The future resolves to the saved title, or None when the placeholder is kept
+    return _EXECUTOR.submit(_generate_title, model, thread_id, user_id, user_input)
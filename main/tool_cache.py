@@ -0,0 +1,138 @@
+import os,json,hashlib,asyncio,logging,threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable
+from psycopg.types.json import Jsonb
+from cache import LRUCache
+from database_utils import get_conn
+
+logger = logging.getLogger(__name__)
+
+# Postgres tier lets every replica share results; off unless enabled
+TOOL_CACHE_DB = os.getenv("TOOL_CACHE_DB", "false").lower() == "true"
+
+
+@dataclass(frozen=True)
+class ToolCachePolicy:
+    ttl: float # seconds
+    normalize: Callable[[dict], dict] # Returned args are both the cache key and what the tool is called with
+
+
+def _normalize_coordinates(args:dict) -> dict:
+    # 0.1 degree grid (~11km); temperatures barely differ inside a cell
+    return {k: round(float(v), 1) for k, v in args.items()}
+
+def _normalize_query(args:dict) -> dict:
+    query = args.get("query", args.get("tool_input", ""))
+    return {"query": " ".join(str(query).lower().split())}
+
+
+# get_conversion_rate is served from exchange_rates.RateTable, which already is a cache
+DEFAULT_POLICIES = {
+    "get_weather": ToolCachePolicy(ttl=600, normalize=_normalize_coordinates),
+    "duckduckgo_search": ToolCachePolicy(ttl=300, normalize=_normalize_query),
+}
+
+
+class ToolResultCache:
+    def __init__(self, policies:dict[str, ToolCachePolicy] = DEFAULT_POLICIES, memory:LRUCache | None = None, use_db:bool = TOOL_CACHE_DB):
+        self.policies = policies
+        self.memory = memory if memory is not None else LRUCache(max_entries=2048)
+        self.use_db = use_db
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"memory_hits": 0, "db_hits": 0, "misses": 0})
+
+    def _key(self, tool_name:str, args:dict) -> str:
+        payload = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha256(f"{tool_name}\x00{payload}".encode("utf-8")).hexdigest()
+
+    def _count(self, tool_name:str, field:str):
+        with self._lock:
+            self._counts[tool_name][field] += 1
+
+    def _db_get(self, key:str):
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT result, EXTRACT(EPOCH FROM expires_at - NOW()) AS ttl FROM tool_cache WHERE cache_key = %s AND expires_at > NOW()",
+                        (key,)
+                    )
+                    return cur.fetchone()
+        except Exception as e:
+            logger.warning(f"Tool cache lookup failed; Error: {e}")
+            return None
+
+    def _db_set(self, key:str, tool_name:str, result:Any, ttl:float):
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO tool_cache (cache_key, tool_name, result, expires_at) VALUES (%s,%s,%s,NOW() + make_interval(secs => %s))
+                        ON CONFLICT (cache_key) DO UPDATE SET result = EXCLUDED.result, expires_at = EXCLUDED.expires_at
+                        """,
+                        (key, tool_name, Jsonb(result), ttl)
+                    )
+        except Exception as e:
+            logger.warning(f"Tool cache write failed; Error: {e}")
+
+    def _lookup(self, tool_name:str, key:str):
+        sentinel = object()
+        value = self.memory.get(key, sentinel)
+        if value is not sentinel:
+            self._count(tool_name, "memory_hits")
+            return True, value
+        if self.use_db:
+            row = self._db_get(key)
+            if row is not None:
+                # Keep the shared expiry instead of restarting the TTL locally
+                self.memory.set(key, row['result'], ttl=float(row['ttl']))
+                self._count(tool_name, "db_hits")
+                return True, row['result']
+        self._count(tool_name, "misses")
+        return False, None
+
+    def _store(self, tool_name:str, key:str, result:Any, ttl:float):
+        self.memory.set(key, result, ttl=ttl)
+        if self.use_db:
+            self._db_set(key, tool_name, result, ttl)
+
+    def invoke(self, tool, args:dict):
+        policy = self.policies.get(tool.name)
+        if policy is None:
+            return tool.invoke(args)
+        args = policy.normalize(args)
+        key = self._key(tool.name, args)
+        found, value = self._lookup(tool.name, key)
+        if found:
+            return value
+        result = tool.invoke(args)
+        self._store(tool.name, key, result, policy.ttl)
+        return result
+
+    async def ainvoke(self, tool, args:dict):
+        policy = self.policies.get(tool.name)
+        if policy is None:
+            return await tool.ainvoke(args)
+        args = policy.normalize(args)
+        key = self._key(tool.name, args)
+        # The database tier is synchronous, keep it off the event loop
+        found, value = await asyncio.to_thread(self._lookup, tool.name, key)
+        if found:
+            return value
+        result = await tool.ainvoke(args)
+        await asyncio.to_thread(self._store, tool.name, key, result, policy.ttl)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for tool_name, counts in self._counts.items():
+                lookups = sum(counts.values())
+                hits = counts["memory_hits"] + counts["db_hits"]
+                result[tool_name] = {**counts, "hit_rate": hits / lookups if lookups else 0.0}
+            return result
+
+
+tool_cache = ToolResultCache()
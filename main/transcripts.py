@@ -0,0 +1,128 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+from langchain_core.documents import Document
+from cache import LRUCache
+from database_utils import get_stored_transcript,save_transcript
+from RAG import get_chunk_size,make_content_hash,index_chunks,attach_existing_index,get_retriever
+
+TRANSCRIPT_LANGUAGES = ["en"]
+CHUNKS_PER_BATCH = 32
+
+# Raised when the video has no usable captions
+class TranscriptUnavailable(Exception):
+    pass
+
+# Snippets are small (text + start + duration); keep recently used videos out of the database round trip
+_TRANSCRIPTS = LRUCache(max_entries=256)
+
+# One fetch and one embedding pass per video even when many threads ask about it at the same moment.
+# video_id -> [lock, holders and waiters]; the entry is dropped by the last one out so the dict only holds videos in flight
+_VIDEO_LOCKS: dict[str, list] = {}
+_VIDEO_LOCKS_GUARD = threading.Lock()
+
+@contextmanager
+def _video_lock(video_id:str):
+    with _VIDEO_LOCKS_GUARD:
+        entry = _VIDEO_LOCKS.setdefault(video_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _VIDEO_LOCKS_GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                del _VIDEO_LOCKS[video_id]
+
+
+def _fetch_snippets(video_id:str) -> list[dict]:
+    from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+    try:
+        fetched = YouTubeTranscriptApi().fetch(video_id, languages=TRANSCRIPT_LANGUAGES)
+    except (TranscriptsDisabled, NoTranscriptFound) as e:
+        raise TranscriptUnavailable(str(e)) from e
+    return [{"text": s.text, "start": s.start, "duration": s.duration} for s in fetched]
+
+
+def get_transcript(video_id:str) -> list[dict]:
+    # memory -> transcripts table -> YouTube
+    snippets = _TRANSCRIPTS.get(video_id)
+    if snippets is None:
+        snippets = get_stored_transcript(video_id)
+        if snippets is None:
+            snippets = _fetch_snippets(video_id)
+            save_transcript(video_id, TRANSCRIPT_LANGUAGES[0], snippets)
+        _TRANSCRIPTS.set(video_id, snippets)
+    return snippets
+
+
+def format_timestamp(seconds:float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def chunk_snippets(snippets:list[dict], source:str, video_id:str) -> Iterator[Document]:
+    """
+    Group consecutive snippets into chunks of about chunk_size characters, carrying the last snippets of a chunk
+    over as overlap. Each chunk keeps the start and end time of the speech it covers.
+    """
+    chunk = get_chunk_size("YTvideo")
+    buffer: list[dict] = []
+    length = 0
+    fresh = False # buffer holds snippets not yet part of an emitted chunk
+
+    def emit() -> Document:
+        start = buffer[0]["start"]
+        end = buffer[-1]["start"] + buffer[-1]["duration"]
+        return Document(
+            page_content=" ".join(s["text"] for s in buffer),
+            metadata={"source": source, "platform": "Youtube", "video_id": video_id, "start": start, "end": end,
+                      "timestamp": f"{format_timestamp(start)}-{format_timestamp(end)}"}
+        )
+
+    for snippet in snippets:
+        text = snippet["text"].strip()
+        if not text:
+            continue
+        buffer.append({**snippet, "text": text})
+        length += len(text) + 1
+        fresh = True
+        if length >= chunk["chunk_size"]:
+            yield emit()
+            fresh = False
+            # Keep trailing snippets worth about chunk_overlap characters
+            overlap: list[dict] = []
+            overlap_length = 0
+            for s in reversed(buffer[1:]):
+                if overlap_length >= chunk["chunk_overlap"]:
+                    break
+                overlap.insert(0, s)
+                overlap_length += len(s["text"]) + 1
+            buffer, length = overlap, overlap_length
+    if buffer and fresh:
+        yield emit()
+
+
+def _batched(documents:Iterator[Document], size:int) -> Iterator[List[Document]]:
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def index_video(video_id:str, url:str, thread_id, user_id):
+    # Returns a retriever for the thread, reusing the shared index when this video was indexed before
+    content_hash = make_content_hash(video_id.encode("utf-8"), "YTvideo")
+    with _video_lock(video_id):
+        if not attach_existing_index(thread_id, user_id, "YTvideo", content_hash):
+            snippets = get_transcript(video_id)
+            if not snippets:
+                raise TranscriptUnavailable("Transcript is empty")
+            index_chunks(_batched(chunk_snippets(snippets, url, video_id), CHUNKS_PER_BATCH), thread_id, user_id, "YTvideo", content_hash)
+    return get_retriever(thread_id, user_id, doc_type="YTvideo")
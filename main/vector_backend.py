@@ -0,0 +1,141 @@
+import os,json,shutil,uuid,functools
+from pathlib import Path
+from typing import Iterable, Literal
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from faiss_index import optimize_index,load_index
+from database_utils import attach_index,store_vector_chunks,attach_stored_vectors,search_vector_chunks
+
+# faiss: indexes on the local disk of the replica that built them; pgvector: chunks in Postgres, readable from every replica
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss").lower()
+
+BASE_DIR =  Path.cwd()
+
+
+def get_index_path(content_hash:str, doc_type: Literal["YTvideo", "pdf"]) -> Path:
+    return BASE_DIR / "data" / "faiss_store" / doc_type / content_hash
+
+
+def iter_faiss_rows(vector_store) -> Iterable[tuple[str, dict, list[float]]]:
+    # (text, metadata, vector) in index order, read back from a built FAISS store
+    index = vector_store.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    for position, vector in enumerate(vectors):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+        yield doc.page_content, doc.metadata, vector.tolist()
+
+
+# Read side of a pgvector index: one content hash in vector_chunks. Holds no vectors itself, so it is cheap to create and cache
+class PgVectorStore(VectorStore):
+    def __init__(self, content_hash:str, embedding:Embeddings):
+        self.content_hash = content_hash
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("pgvector indexes are written by PgVectorBackend.save")
+
+    def _to_documents(self, rows:list[dict]) -> list[tuple[Document, float]]:
+        return [(Document(page_content=row['content'], metadata=row['metadata']), row['distance']) for row in rows]
+
+    def search_by_vectors(self, vectors:list[list[float]], k:int = 4) -> list[list[Document]]:
+        results = search_vector_chunks(self.content_hash, vectors, k)
+        return [[doc for doc, _ in self._to_documents(rows)] for rows in results]
+
+    def similarity_search_with_score_by_vector(self, embedding:list[float], k:int = 4, **kwargs) -> list[tuple[Document, float]]:
+        return self._to_documents(search_vector_chunks(self.content_hash, [embedding], k)[0])
+
+    def similarity_search_by_vector(self, embedding:list[float], k:int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query:str, k:int = 4, **kwargs) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def max_marginal_relevance_search_by_vector(self, embedding:list[float], k:int = 4, fetch_k:int = 20, lambda_mult:float = 0.5, **kwargs) -> list[Document]:
+        import numpy as np
+        from langchain_core.vectorstores.utils import maximal_marginal_relevance
+        rows = search_vector_chunks(self.content_hash, [embedding], fetch_k, with_embeddings=True)[0]
+        if not rows:
+            return []
+        candidates = [json.loads(row['embedding']) for row in rows]
+        selected = maximal_marginal_relevance(np.array(embedding, dtype=np.float32), candidates, lambda_mult=lambda_mult, k=k)
+        return [Document(page_content=rows[i]['content'], metadata=rows[i]['metadata']) for i in selected]
+
+    def max_marginal_relevance_search(self, query:str, k:int = 4, fetch_k:int = 20, lambda_mult:float = 0.5, **kwargs) -> list[Document]:
+        return self.max_marginal_relevance_search_by_vector(self._embedding.embed_query(query), k, fetch_k, lambda_mult)
+
+
+# Where finished indexes are persisted and how they are found again. Building (embedding, partial publishing,
+# caching) is the same for every backend and stays in RAG.
+class FAISSBackend:
+    name = "faiss"
+
+    def save(self, vector_store, thread_id:uuid.UUID, user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"], content_hash:str):
+        path = get_index_path(content_hash, doc_type)
+        if not path.exists():
+            # Flat, HNSW or IVF by chunk count; the in-memory store used by this process gets the same structure
+            optimize_index(vector_store)
+        # Garbage collection may remove an unreferenced copy of the same content between the write and the attach;
+        # write it again then
+        while True:
+            if not path.exists():
+                self._write(vector_store, path, content_hash)
+            if attach_index(thread_id, user_id, doc_type, content_hash, exists=path.exists):
+                return
+
+    def _write(self, vector_store, path:Path, content_hash:str):
+        # Write to a scratch folder and rename so readers never see half an index
+        tmp_path = path.with_name(f"{content_hash}.tmp-{uuid.uuid4().hex}")
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        vector_store.save_local(folder_path=str(tmp_path), index_name=content_hash)
+        try:
+            tmp_path.rename(path)
+        except OSError:
+            # Another session saved the same content first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def attach_existing(self, thread_id:uuid.UUID, user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"], content_hash:str) -> bool:
+        # Only reuse indexes present on this machine; attaching (re)registers them if the registry lost track. The
+        # existence check runs under the lock garbage collection deletes under
+        path = get_index_path(content_hash, doc_type)
+        return attach_index(thread_id, user_id, doc_type, content_hash, exists=path.exists)
+
+    def load(self, content_hash:str, doc_type: Literal["YTvideo", "pdf"], embeddings:Embeddings):
+        path = get_index_path(content_hash, doc_type)
+        if not path.exists():
+            return None
+        return load_index(path, content_hash, embeddings)
+
+    def delete(self, content_hash:str, doc_type: Literal["YTvideo", "pdf"]):
+        shutil.rmtree(get_index_path(content_hash, doc_type), ignore_errors=True)
+
+
+class PgVectorBackend:
+    name = "pgvector"
+
+    def save(self, vector_store, thread_id:uuid.UUID, user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"], content_hash:str):
+        store_vector_chunks(thread_id, user_id, doc_type, content_hash, iter_faiss_rows(vector_store))
+
+    def attach_existing(self, thread_id:uuid.UUID, user_id:uuid.UUID, doc_type: Literal["YTvideo", "pdf"], content_hash:str) -> bool:
+        return attach_stored_vectors(thread_id, user_id, doc_type, content_hash)
+
+    def load(self, content_hash:str, doc_type: Literal["YTvideo", "pdf"], embeddings:Embeddings):
+        # Nothing to read up front; get_retriever only gets here for hashes registered to the thread
+        return PgVectorStore(content_hash, embeddings)
+
+    def delete(self, content_hash:str, doc_type: Literal["YTvideo", "pdf"]):
+        pass # vector_chunks rows go with their vector_indexes row (ON DELETE CASCADE)
+
+
+VECTOR_BACKENDS = {"faiss": FAISSBackend, "pgvector": PgVectorBackend}
+
+@functools.cache
+def get_vector_backend():
+    if VECTOR_BACKEND not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}; expected one of {', '.join(VECTOR_BACKENDS)}")
+    return VECTOR_BACKENDS[VECTOR_BACKEND]()
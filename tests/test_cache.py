@@ -0,0 +1,65 @@
+import time
+import pytest
+import cache
+from cache import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1 # b is now the least recently used
+    lru.set("c", 3)
+    assert "b" not in lru
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_evicts_by_bytes():
+    lru = LRUCache(max_entries=100, max_bytes=10, sizeof=len)
+    lru.set("a", "xxxx")
+    lru.set("b", "xxxx")
+    lru.set("c", "xxxx")
+    assert "a" not in lru and len(lru) == 2
+    lru.set("big", "x" * 11) # Larger than the whole budget: not cached, nothing else evicted
+    assert "big" not in lru and len(lru) == 2
+    assert lru.stats()["bytes"] == 8
+
+
+def test_ttl_expires_on_read(clock):
+    lru = LRUCache(max_entries=10, default_ttl=5)
+    lru.set("a", 1)
+    lru.set("b", 2, ttl=60)
+    clock[0] += 10
+    assert "a" not in lru
+    assert lru.get("a") is None
+    assert lru.get("b") == 2
+    assert lru.stats()["expirations"] == 1
+
+
+def test_expired_entries_leave_from_the_lru_end_before_live_ones(clock):
+    lru = LRUCache(max_entries=3)
+    lru.set("old", 1, ttl=5)
+    lru.set("a", 2)
+    lru.set("b", 3)
+    clock[0] += 10
+    lru.set("c", 4)
+    assert [k for k in ("a", "b", "c") if k in lru] == ["a", "b", "c"]
+    stats = lru.stats()
+    assert stats["expirations"] == 1 and stats["evictions"] == 0
+
+
+def test_set_does_not_scan_every_entry():
+    lru = LRUCache(max_entries=20_000, default_ttl=3600)
+    start = time.perf_counter()
+    for i in range(20_000):
+        lru.set(i, i)
+    assert time.perf_counter() - start < 2 # Scanning for expired entries on every set took ~25 s
+    assert len(lru) == 20_000
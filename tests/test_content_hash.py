@@ -0,0 +1,11 @@
+from types import SimpleNamespace
+import RAG
+
+
+def test_content_hash_depends_on_the_embedding_model(monkeypatch):
+    monkeypatch.setattr(RAG, "get_embedding_model", lambda: SimpleNamespace(model_name="sentence-transformers/all-MiniLM-L6-v2"))
+    minilm = RAG.make_content_hash(b"same document", "pdf")
+    assert minilm == RAG.make_content_hash(b"same document", "pdf")
+    assert minilm != RAG.make_content_hash(b"same document", "YTvideo")
+    monkeypatch.setattr(RAG, "get_embedding_model", lambda: SimpleNamespace(model_name="sentence-transformers/all-MiniLM-L6-v2@qint8"))
+    assert minilm != RAG.make_content_hash(b"same document", "pdf")
@@ -0,0 +1,60 @@
+from langchain_core.documents import Document
+from context_packing import pack_documents
+
+
+def page(text:str, page:int = 1, source:str = "a.pdf") -> Document:
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+WORDS = " ".join(f"word{i}" for i in range(200))
+
+
+def test_merges_overlapping_chunks_of_the_same_passage():
+    first, second = WORDS[:600], WORDS[500:]
+    docs, report = pack_documents([page(second), page(first)], budget=10_000)
+    assert [d.page_content for d in docs] == [WORDS]
+    assert report["chunks_in"] == 2 and report["chunks_out"] == 1
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"] > 0
+
+
+def test_drops_chunks_contained_in_another():
+    docs, _ = pack_documents([page(WORDS), page(WORDS[100:300])], budget=10_000)
+    assert [d.page_content for d in docs] == [WORDS]
+
+
+def test_keeps_other_pages_and_sources_apart():
+    chunk = WORDS[:300]
+    docs, _ = pack_documents([page(chunk), page(chunk, page=2), page(chunk, source="b.pdf")], budget=10_000)
+    assert len(docs) == 3
+
+
+def test_merged_passage_takes_the_rank_of_its_best_chunk():
+    other = page("unrelated passage " * 10, page=5)
+    docs, _ = pack_documents([other, page(WORDS[500:]), page(WORDS[:600])], budget=10_000)
+    assert docs[0] is other and docs[1].page_content == WORDS
+
+
+def test_budget_trims_the_last_passage():
+    docs, report = pack_documents([page(WORDS, page=1), page(WORDS, page=2)], budget=500)
+    assert len(docs) == 2
+    assert docs[1].metadata["truncated"] and docs[1].page_content.endswith(" ...")
+    assert report["tokens_out"] <= 500 + 1
+
+
+def test_budget_drops_a_passage_too_short_to_trim():
+    docs, _ = pack_documents([page(WORDS, page=1), page(WORDS, page=2)], budget=400)
+    assert [d.metadata["page"] for d in docs] == [1]
+
+
+def test_always_keeps_part_of_the_best_passage():
+    docs, _ = pack_documents([page(WORDS)], budget=10)
+    assert len(docs) == 1 and docs[0].metadata["truncated"]
+
+
+def test_timestamps_of_merged_transcript_chunks():
+    meta = {"source": "video", "video_id": "abc"}
+    first = Document(page_content=WORDS[:600], metadata={**meta, "start": 0.0, "end": 30.0})
+    second = Document(page_content=WORDS[500:], metadata={**meta, "start": 25.0, "end": 65.0})
+    docs, _ = pack_documents([first, second], budget=10_000)
+    assert docs[0].metadata["start"] == 0.0 and docs[0].metadata["end"] == 65.0
+    assert docs[0].metadata["timestamp"] == "0:00-1:05"
@@ -0,0 +1,50 @@
+from langchain_core.messages import AIMessage,HumanMessage,ToolMessage
+from context_window import TOOL_OUTPUT_STUB_CHARS,estimate_tokens,plan_context
+
+
+def turn(i:int, tool_output:str = "") -> list:
+    # One user turn: question, a tool call and its output when given, then the answer
+    messages = [HumanMessage(content=f"question {i} " + "q" * 200)]
+    if tool_output:
+        messages.append(AIMessage(content="", tool_calls=[{"name": "search", "args": {"query": f"q{i}"}, "id": f"call{i}"}]))
+        messages.append(ToolMessage(content=tool_output, name="search", tool_call_id=f"call{i}"))
+    messages.append(AIMessage(content=f"answer {i} " + "a" * 200))
+    return messages
+
+
+def test_everything_fits():
+    messages = turn(0) + turn(1)
+    kept, summarized = plan_context(messages, budget=10_000)
+    assert kept == messages and summarized == 0
+
+
+def test_older_tool_outputs_are_stubbed_latest_kept():
+    long_output = "x" * (TOOL_OUTPUT_STUB_CHARS + 1)
+    messages = turn(0, long_output) + turn(1, long_output)
+    kept, _ = plan_context(messages, budget=10_000)
+    tool_messages = [m for m in kept if isinstance(m, ToolMessage)]
+    assert "omitted" in tool_messages[0].content and tool_messages[0].tool_call_id == "call0"
+    assert tool_messages[1].content == long_output
+
+
+def test_drops_whole_turns_from_the_front():
+    messages = turn(0, "result") + turn(1, "result") + turn(2)
+    per_turn = sum(estimate_tokens(m) for m in turn(1, "result"))
+    kept, summarized = plan_context(messages, budget=per_turn + sum(estimate_tokens(m) for m in turn(2)))
+    assert summarized == len(turn(0, "result"))
+    assert kept == messages[summarized:]
+    assert isinstance(kept[0], HumanMessage) # A tool result never loses the call that produced it
+
+
+def test_latest_turn_kept_even_over_budget():
+    messages = turn(0) + turn(1, "y" * 5_000)
+    kept, summarized = plan_context(messages, budget=10)
+    assert kept == turn(1, "y" * 5_000)
+    assert summarized == len(turn(0))
+
+
+def test_counts_from_already_summarized_messages():
+    messages = turn(0) + turn(1) + turn(2)
+    kept, summarized = plan_context(messages, summarized_count=len(turn(0)), budget=10_000)
+    assert kept == messages[len(turn(0)):]
+    assert summarized == len(turn(0))
@@ -0,0 +1,89 @@
+import functools,threading,time
+import numpy as np
+import embedding_backends
+from embedding_backends import LocalEmbeddings,StubEmbeddings
+from embedding_cache import CachedEmbeddings,vector_cache
+
+
+class CountingEmbeddings(StubEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def offline(embeddings, memory_cache=None) -> CachedEmbeddings:
+    cached = CachedEmbeddings(embeddings, model_name="stub", memory_cache=memory_cache)
+    cached._fetch_from_db = lambda keys: {}
+    cached._store_in_db = lambda rows: None
+    return cached
+
+
+def test_memory_tier_holds_float32_and_returns_lists():
+    embeddings = CountingEmbeddings()
+    cached = offline(embeddings)
+    first = cached.embed_documents(["a", "b", "a"])
+    again = cached.embed_documents(["b", "a"])
+    assert embeddings.embedded == 2
+    assert again == [first[1], first[0]]
+    assert all(isinstance(v, list) and isinstance(v[0], float) for v in first)
+    assert np.allclose(first[0], embeddings.embed_query("a"), atol=1e-6)
+    stored = cached.memory_cache.get(next(iter(cached.memory_cache._entries)))
+    assert stored.dtype == np.float32
+    assert cached.stats()["bytes"] == 2 * embeddings.dimensions * 4
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    embeddings = CountingEmbeddings()
+    cache = vector_cache(max_mb=10 * embeddings.dimensions * 4 / (1024 * 1024))
+    cached = offline(embeddings, cache)
+    cached.embed_documents([f"text {i}" for i in range(25)])
+    assert len(cache) == 10
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_local_model_loads_once_across_threads(monkeypatch):
+    loads = []
+
+    class Model:
+        def encode(self, texts, **kwargs):
+            return np.zeros((len(texts), 4), dtype=np.float32)
+
+    @functools.cache
+    def load(*args):
+        loads.append(args)
+        time.sleep(0.05)
+        return Model()
+
+    monkeypatch.setattr(embedding_backends, "_load_sentence_transformer", load)
+    instances = [LocalEmbeddings(model_name="m") for _ in range(4)]
+    threads = [threading.Thread(target=e.embed_query, args=("q",)) for e in instances for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+
+
+class PromptedEmbeddings(CountingEmbeddings):
+    # Like models with a query prompt: a query and a document with the same text get different vectors
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(f"query: {text}")
+
+
+def test_queries_do_not_share_keys_with_documents():
+    embeddings = PromptedEmbeddings()
+    cached = offline(embeddings)
+    document = cached.embed_documents(["a"])[0]
+    query = cached.embed_query("a")
+    assert embeddings.queries == ["a"]
+    assert not np.allclose(document, query)
+    assert cached.embed_query("a") == query and embeddings.queries == ["a"]
@@ -0,0 +1,40 @@
+import asyncio,threading
+import exchange_rates
+from exchange_rates import RateTable
+
+SNAPSHOT = {"conversion_rates": {"USD": 1.0, "EUR": 0.5, "JPY": 150.0}}
+
+
+def test_concurrent_arate_fetches_once(monkeypatch):
+    fetches = []
+
+    async def get_json(url, name=None):
+        fetches.append(url)
+        await asyncio.sleep(0.05)
+        return SNAPSHOT
+
+    monkeypatch.setattr(exchange_rates.async_http_client, "get_json", get_json)
+    table = RateTable(use_db=False)
+
+    async def main():
+        return await asyncio.gather(*(table.arate("eur", "jpy") for _ in range(20)))
+
+    assert asyncio.run(main()) == [300.0] * 20
+    assert len(fetches) == 1 and table.upstream_fetches == 1
+
+
+def test_arefresh_keeps_database_work_off_the_event_loop(monkeypatch):
+    threads = []
+
+    async def get_json(url, name=None):
+        return SNAPSHOT
+
+    monkeypatch.setattr(exchange_rates.async_http_client, "get_json", get_json)
+    table = RateTable(use_db=True)
+    monkeypatch.setattr(table, "_load_from_db", lambda: threads.append(("load", threading.current_thread())) or False)
+    monkeypatch.setattr(table, "_save_to_db", lambda: threads.append(("save", threading.current_thread())))
+
+    asyncio.run(table.arefresh())
+    assert [op for op, _ in threads] == ["load", "save"]
+    assert all(thread is not threading.main_thread() for _, thread in threads)
+    assert table.rate("USD", "EUR") == 0.5
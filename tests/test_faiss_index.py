@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+faiss = pytest.importorskip("faiss")
+import faiss_index
+from faiss_index import choose_factory,optimize_index
+
+
+class Store:
+    # The attributes of a langchain FAISS store that optimize_index touches
+    def __init__(self, vectors:np.ndarray):
+        self.index = faiss.IndexFlatL2(vectors.shape[1])
+        self.index.add(vectors)
+
+
+def test_choose_factory_by_size():
+    assert choose_factory(1_000, 384, "auto", "none") == "Flat"
+    assert choose_factory(100_000, 384, "auto", "none") == "HNSW32"
+    assert choose_factory(1_000_000, 384, "auto", "sq8") == "IVF4000,SQ8"
+
+
+def test_pq_falls_back_to_sq8_without_enough_training_vectors():
+    assert choose_factory(100, 384, "flat", "pq") == "SQ8"
+    assert choose_factory(faiss_index.PQ_MIN_TRAIN - 1, 384, "hnsw", "pq") == "HNSW32_SQ8"
+    assert choose_factory(faiss_index.PQ_MIN_TRAIN, 384, "flat", "pq") == "PQ48"
+
+
+@pytest.mark.parametrize("n", [50, 255, 1_000])
+def test_optimize_small_index_with_pq(monkeypatch, n):
+    # FAISS_INDEX_TYPE=flat FAISS_QUANTIZATION=pq
+    monkeypatch.setattr(faiss_index, "choose_factory", lambda n, d: choose_factory(n, d, "flat", "pq"))
+    store = Store(np.random.default_rng(0).random((n, 32), dtype=np.float32))
+    report = optimize_index(store)
+    assert report["factory"] == "SQ8"
+    assert store.index.ntotal == n
+
+
+def test_optimize_keeps_upload_sized_indexes_flat():
+    # About the chunk count of a 2 MB PDF; auto builds nothing else
+    store = Store(np.random.default_rng(0).random((2_000, 32), dtype=np.float32))
+    report = optimize_index(store)
+    assert report["factory"] == report["kept"] == "Flat"
+    assert "build_seconds" not in report
+    assert isinstance(store.index, faiss.IndexFlatL2)
+
+
+@pytest.mark.parametrize("index_type,factory", [("hnsw", "HNSW32"), ("ivf", "IVF51,Flat")])
+def test_optimize_builds_forced_structure(monkeypatch, index_type, factory):
+    monkeypatch.setattr(faiss_index, "choose_factory", lambda n, d: choose_factory(n, d, index_type, "none"))
+    monkeypatch.setattr(faiss_index, "FAISS_MIN_RECALL", 0.5)
+    store = Store(np.random.default_rng(0).random((2_000, 32), dtype=np.float32))
+    report = optimize_index(store)
+    assert report["factory"] == report["kept"] == factory
+    assert report["recall"] >= 0.5
+    assert not isinstance(store.index, faiss.IndexFlatL2)
+    assert store.index.ntotal == 2_000
+
+
+def test_optimize_reverts_to_flat_below_min_recall(monkeypatch):
+    monkeypatch.setattr(faiss_index, "choose_factory", lambda n, d: choose_factory(n, d, "ivf", "none"))
+    monkeypatch.setattr(faiss_index, "FAISS_MIN_RECALL", 1.01)
+    store = Store(np.random.default_rng(0).random((2_000, 32), dtype=np.float32))
+    report = optimize_index(store)
+    assert report["kept"] == "Flat"
+    assert isinstance(store.index, faiss.IndexFlatL2)
+
+
+@pytest.mark.parametrize("factory,mode", [("Flat", "mmap_codes"), ("HNSW32", "mmap_codes"), ("IVF16,Flat", "mmap_lists")])
+def test_load_index_memory_maps(tmp_path, caplog, factory, mode):
+    pytest.importorskip("langchain_community")
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from embedding_backends import StubEmbeddings
+    vectors = np.random.default_rng(0).random((1_000, 32), dtype=np.float32)
+    index = faiss.index_factory(32, factory)
+    index.train(vectors)
+    index.add(vectors)
+    docs = [Document(page_content=f"chunk {i}") for i in range(len(vectors))]
+    store = FAISS.from_embeddings([(d.page_content, v.tolist()) for d, v in zip(docs, vectors)], StubEmbeddings(32))
+    store.index = index
+    store.save_local(str(tmp_path), index_name="doc")
+
+    with caplog.at_level("INFO", logger="faiss_index"):
+        loaded = faiss_index.load_index(tmp_path, "doc", StubEmbeddings(32))
+    assert loaded.mmapped
+    assert f"with {mode}" in caplog.text
+    assert loaded.similarity_search_by_vector(vectors[7].tolist(), k=1)[0].page_content == "chunk 7"
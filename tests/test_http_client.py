@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import http_client
+from http_client import AsyncHttpClient,HttpClient,HttpClientError,LatencyRecorder
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /flaky fails with 503 until `failures` requests have been seen, /reset drops the first connection,
+    # /slow sleeps past the client's read timeout and /busy records how many requests are in flight
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+        if self.path == "/flaky" and hits <= server.failures:
+            return self._send(503, {"error": "unavailable"})
+        if self.path == "/reset" and hits == 1:
+            self.close_connection = True
+            return
+        if self.path == "/slow":
+            time.sleep(0.5)
+        if self.path == "/busy":
+            with server.lock:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            time.sleep(0.1)
+            with server.lock:
+                server.in_flight -= 1
+        self._send(200, {"path": self.path, "hits": hits})
+
+    def _send(self, status:int, body:dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = {}
+    server.failures = 2
+    server.in_flight = 0
+    server.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "_backoff", lambda attempt: 0)
+
+
+def test_retries_5xx_until_success(server):
+    latency = LatencyRecorder()
+    client = HttpClient(max_retries=2, latency=latency)
+    assert client.get_json(f"{server.url}/flaky", name="flaky") == {"path": "/flaky", "hits": 3}
+    stats = latency.stats()["flaky"]
+    assert stats["requests"] == 1 and stats["retries"] == 2 and stats["errors"] == 0
+
+
+def test_gives_up_after_max_retries(server):
+    server.failures = 10
+    latency = LatencyRecorder()
+    client = HttpClient(max_retries=1, latency=latency)
+    with pytest.raises(HttpClientError, match="after 2 attempts"):
+        client.get_json(f"{server.url}/flaky", name="flaky")
+    assert server.hits["/flaky"] == 2
+    assert latency.stats()["flaky"]["errors"] == 1
+
+
+def test_retries_connection_reset(server):
+    client = HttpClient(max_retries=1, latency=LatencyRecorder())
+    assert client.get_json(f"{server.url}/reset") == {"path": "/reset", "hits": 2}
+
+
+def test_read_timeout_is_retried_then_raised(server):
+    client = HttpClient(read_timeout=0.1, max_retries=1, latency=LatencyRecorder())
+    start = time.perf_counter()
+    with pytest.raises(HttpClientError, match="after 2 attempts"):
+        client.get_json(f"{server.url}/slow")
+    assert time.perf_counter() - start < 1.0
+
+
+def test_per_host_limit_caps_concurrency(server):
+    client = HttpClient(per_host_limit=2, latency=LatencyRecorder())
+    threads = [threading.Thread(target=client.get_json, args=(f"{server.url}/busy",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.hits["/busy"] == 6
+    assert server.max_in_flight == 2
+
+
+def test_host_slot_wait_is_bounded_by_timeout(server):
+    client = HttpClient(connect_timeout=0.05, read_timeout=0.1, per_host_limit=1, latency=LatencyRecorder())
+    slot = client._host_limit(f"{server.url}/busy")
+    slot.acquire()
+    try:
+        start = time.perf_counter()
+        with pytest.raises(HttpClientError, match="request slot"):
+            client.get_json(f"{server.url}/busy")
+        assert time.perf_counter() - start < 1.0
+    finally:
+        slot.release()
+    assert "/busy" not in server.hits
+
+
+def test_async_retries_and_caps_concurrency(server):
+    async def run():
+        client = AsyncHttpClient(max_retries=2, per_host_limit=2, latency=LatencyRecorder())
+        try:
+            flaky = await client.get_json(f"{server.url}/flaky")
+            await asyncio.gather(*(client.get_json(f"{server.url}/busy") for _ in range(6)))
+            return flaky
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {"path": "/flaky", "hits": 3}
+    assert server.max_in_flight == 2
@@ -0,0 +1,58 @@
+import threading,time,uuid
+import pytest
+
+
+@pytest.fixture
+def faiss_backend(monkeypatch, tmp_path):
+    import vector_backend
+    monkeypatch.setattr(vector_backend, "BASE_DIR", tmp_path)
+    return vector_backend.FAISSBackend()
+
+
+def references(db, content_hash:str) -> int:
+    with db.get_conn() as conn:
+        return conn.execute("SELECT count(*) AS n FROM thread_indexes WHERE content_hash = %s", (content_hash,)).fetchone()['n']
+
+
+def test_attach_during_gc_waits_and_finds_the_index_gone(db, user_id, faiss_backend):
+    import vector_backend
+    content_hash = f"test-{uuid.uuid4().hex}"
+    path = vector_backend.get_index_path(content_hash, "pdf")
+    path.mkdir(parents=True)
+    assert faiss_backend.attach_existing(uuid.uuid4(), user_id, "pdf", content_hash)
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM thread_indexes WHERE content_hash = %s", (content_hash,)) # The thread was deleted
+
+    # A new upload of the same content arrives while garbage collection is removing the files
+    attached = []
+    def remove(removed_hash:str, doc_type:str):
+        if removed_hash != content_hash:
+            return
+        upload = threading.Thread(target=lambda: attached.append(faiss_backend.attach_existing(uuid.uuid4(), user_id, "pdf", content_hash)))
+        upload.start()
+        time.sleep(0.3)
+        assert upload.is_alive() # Blocked on the content hash lock
+        faiss_backend.delete(removed_hash, doc_type)
+        remove.upload = upload
+
+    removed = db.delete_unreferenced_indexes(remove)
+    remove.upload.join(5)
+    assert content_hash in [row['content_hash'] for row in removed]
+    assert attached == [False] # The upload builds a new index instead of pointing at deleted files
+    assert references(db, content_hash) == 0
+
+
+def test_gc_keeps_an_index_attached_first(db, user_id, faiss_backend):
+    import vector_backend
+    content_hash = f"test-{uuid.uuid4().hex}"
+    vector_backend.get_index_path(content_hash, "pdf").mkdir(parents=True)
+    thread_id = uuid.uuid4()
+    try:
+        assert faiss_backend.attach_existing(thread_id, user_id, "pdf", content_hash)
+        removed = db.delete_unreferenced_indexes(lambda content_hash, doc_type: faiss_backend.delete(content_hash, doc_type))
+        assert content_hash not in [row['content_hash'] for row in removed]
+        assert vector_backend.get_index_path(content_hash, "pdf").exists()
+    finally:
+        with db.get_conn() as conn:
+            conn.execute("DELETE FROM thread_indexes WHERE content_hash = %s", (content_hash,))
+            conn.execute("DELETE FROM vector_indexes WHERE content_hash = %s", (content_hash,))
@@ -0,0 +1,108 @@
+import pytest
+import llm_scheduler
+from llm_scheduler import LLMScheduler,ModelLimits,TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        if retry_after is not None:
+            self.response = type("Response", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+class Result:
+    def __init__(self, total_tokens:int):
+        self.usage_metadata = {"input_tokens": total_tokens - 10, "output_tokens": 10, "total_tokens": total_tokens}
+
+
+class FlakyModel:
+    # Fails with a 429 the first `failures` calls
+    def __init__(self, failures:int):
+        self.failures = failures
+        self.calls = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RateLimitError()
+        return Result(100)
+
+
+def test_token_bucket_wait_and_refill():
+    clock = Clock()
+    bucket = TokenBucket(60, clock) # one per second
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 120
+    assert bucket.wait_time(60) == 0 # Refill stops at one minute's worth
+    assert bucket.wait_time(1_000) == 0 # Larger than the bucket: allowed once it is full
+
+
+def test_token_bucket_debt_from_corrected_usage():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)
+    bucket.consume(60)
+    bucket.consume(30) # Provider reported more than estimated
+    assert bucket.wait_time(1) == pytest.approx(31.0)
+
+
+def test_poll_waits_for_the_bucket_and_queue_order():
+    clock = Clock()
+    scheduler = LLMScheduler({"m": ModelLimits(requests_per_minute=2, tokens_per_minute=1_000)}, clock=clock)
+    first, second = scheduler._enqueue("m"), scheduler._enqueue("m")
+    assert scheduler._poll("m", second, 10) == 0.05 # Not at the head of the queue
+    assert scheduler._poll("m", first, 10) == 0
+    assert scheduler._poll("m", second, 10) == 0
+    third = scheduler._enqueue("m")
+    assert scheduler._poll("m", third, 10) == pytest.approx(30.0) # Both requests of the minute are used
+    clock.now += 30
+    assert scheduler._poll("m", third, 10) == 0
+
+
+def test_429_backoff_doubles_and_resets(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: high)
+    clock = Clock()
+    scheduler = LLMScheduler({"m": ModelLimits(60, 100_000)}, clock=clock)
+    pauses = []
+    for _ in range(8):
+        scheduler.rate_limited("m", RateLimitError())
+        pauses.append(scheduler._state("m").cooldown_until - clock.now)
+    assert pauses == [1, 2, 4, 8, 16, 32, 60, 60]
+    clock.now += 60
+    scheduler.rate_limited("m", RateLimitError(retry_after=7))
+    assert scheduler._state("m").cooldown_until - clock.now == 7 # Retry-After wins over the backoff
+    scheduler.settle("m", 100, Result(100))
+    assert scheduler._state("m").backoff == 0
+    assert scheduler.stats()["m"]["rate_limited"] == 9
+
+
+def test_invoke_retries_rate_limits(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: 0.0)
+    scheduler = LLMScheduler({"m": ModelLimits(600, 100_000)}, max_retries=3)
+    model = FlakyModel(failures=2)
+    result = scheduler.invoke({"m": model}, "m", "hello")
+    assert model.calls == 3
+    assert result.usage_metadata["total_tokens"] == 100
+    assert scheduler.stats()["m"]["rate_limited"] == 2
+
+
+def test_invoke_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: 0.0)
+    scheduler = LLMScheduler({"m": ModelLimits(600, 100_000)}, max_retries=1)
+    model = FlakyModel(failures=5)
+    with pytest.raises(RateLimitError):
+        scheduler.invoke({"m": model}, "m", "hello")
+    assert model.calls == 2
+    assert scheduler.stats()["m"]["queue_depth"] == 0
@@ -0,0 +1,26 @@
+import uuid
+
+
+def turn(i:int) -> list[dict]:
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+def test_backfill_restores_turns_missing_from_the_table(db, user_id):
+    thread_id = uuid.uuid4()
+    checkpoint = turn(0) + turn(1) + [{"role": "assistant", "content": "follow up 1"}] + turn(2)
+    # Only the turn after the messages table was introduced was saved
+    db.save_messages(thread_id, user_id, turn(2))
+    assert db.backfill_messages(thread_id, user_id, checkpoint)
+    rows = db.get_messages(thread_id, user_id, limit=50)
+    assert [{"role": r['role'], "content": r['content']} for r in rows] == checkpoint
+
+
+def test_backfill_leaves_complete_threads_alone(db, user_id):
+    thread_id = uuid.uuid4()
+    db.save_messages(thread_id, user_id, turn(0) + turn(1))
+    # The checkpoint splits the second answer over two messages; same number of turns, so nothing is rewritten
+    checkpoint = turn(0) + [{"role": "user", "content": "question 1"}, {"role": "assistant", "content": "let me look"}, {"role": "assistant", "content": "answer 1"}]
+    ids = [r['id'] for r in db.get_messages(thread_id, user_id)]
+    assert not db.backfill_messages(thread_id, user_id, checkpoint)
+    assert not db.backfill_messages(uuid.uuid4(), user_id, [])
+    assert [r['id'] for r in db.get_messages(thread_id, user_id)] == ids
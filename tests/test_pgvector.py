@@ -0,0 +1,60 @@
+import uuid
+import numpy as np
+import pytest
+
+DIMENSIONS = 384
+
+
+@pytest.fixture
+def documents(db, user_id):
+    # Several documents with chunks from the same region of the space, so a global nearest neighbour search would
+    # mostly find chunks of other documents
+    rng = np.random.default_rng(0)
+    centre = rng.normal(size=DIMENSIONS)
+    hashes = []
+    for doc in range(5):
+        content_hash = f"test-{uuid.uuid4().hex}"
+        vectors = centre + rng.normal(scale=0.1, size=(30, DIMENSIONS))
+        rows = [(f"doc {doc} chunk {i}", {"doc": doc, "chunk": i}, vector.tolist()) for i, vector in enumerate(vectors)]
+        db.store_vector_chunks(uuid.uuid4(), user_id, "pdf", content_hash, rows)
+        hashes.append((content_hash, vectors))
+    yield hashes
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM thread_indexes WHERE user_id = %s", (user_id,))
+        conn.execute("DELETE FROM vector_indexes WHERE content_hash = ANY(%s)", ([h for h, _ in hashes],))
+
+
+def test_search_returns_k_nearest_chunks_of_the_document(db, documents):
+    for doc, (content_hash, vectors) in enumerate(documents):
+        queries = vectors[:3]
+        results = db.search_vector_chunks(content_hash, queries.tolist(), k=10)
+        assert [len(rows) for rows in results] == [10, 10, 10]
+        for query, rows in zip(queries, results):
+            assert all(row['metadata']['doc'] == doc for row in rows)
+            expected = np.argsort(np.linalg.norm(vectors - query, axis=1))[:10]
+            assert [row['metadata']['chunk'] for row in rows] == expected.tolist()
+
+
+def test_mmr_gets_fetch_k_candidates(db, documents):
+    from embedding_backends import StubEmbeddings
+    from vector_backend import PgVectorStore
+    content_hash, vectors = documents[2]
+    rows = db.search_vector_chunks(content_hash, [vectors[0].tolist()], k=20, with_embeddings=True)[0]
+    assert len(rows) == 20
+    docs = PgVectorStore(content_hash, StubEmbeddings()).max_marginal_relevance_search_by_vector(vectors[0].tolist(), k=5, fetch_k=20)
+    assert len(docs) == 5
+    assert all(d.metadata['doc'] == 2 for d in docs)
+
+
+def test_indexes_of_different_widths_share_the_table(db, user_id, documents):
+    # Another embedding model gives another content hash; its chunks sit next to the 384 dimension ones
+    content_hash = f"test-{uuid.uuid4().hex}"
+    vectors = np.random.default_rng(1).normal(size=(8, 768))
+    try:
+        db.store_vector_chunks(uuid.uuid4(), user_id, "pdf", content_hash, [(f"chunk {i}", {"chunk": i}, v.tolist()) for i, v in enumerate(vectors)])
+        rows = db.search_vector_chunks(content_hash, [vectors[3].tolist()], k=3)[0]
+        assert rows[0]['metadata']['chunk'] == 3 and len(rows) == 3
+    finally:
+        with db.get_conn() as conn:
+            conn.execute("DELETE FROM thread_indexes WHERE content_hash = %s", (content_hash,))
+            conn.execute("DELETE FROM vector_indexes WHERE content_hash = %s", (content_hash,))
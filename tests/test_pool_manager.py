@@ -0,0 +1,67 @@
+import threading,time
+import pytest
+from psycopg_pool import ConnectionPool
+from database_utils import CONNECTION_KWARGS
+from pool_manager import PoolManager
+
+
+@pytest.fixture
+def make_pool(db_url):
+    pools = []
+    def make(min_size:int, max_size:int) -> ConnectionPool:
+        pool = ConnectionPool(conninfo=db_url, min_size=min_size, max_size=max_size, open=False, kwargs=CONNECTION_KWARGS)
+        pool.open()
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_warm_up_opens_min_size_connections(make_pool):
+    manager = PoolManager(make_pool(3, 5), keepalive_seconds=0)
+    manager.warm_up(timeout=30)
+    stats = manager.stats()
+    assert stats["pool_size"] >= 3
+    assert stats["healthy"] is True and stats["consecutive_failures"] == 0
+    assert stats["warmup_ms"] is not None and stats["last_latency_ms"] is not None
+
+
+def test_tune_grows_under_contention_and_relaxes_within_bounds(make_pool):
+    pool = make_pool(1, 2)
+    manager = PoolManager(pool, keepalive_seconds=0, max_ceiling=3)
+    manager.warm_up()
+    held = [pool.getconn(), pool.getconn()]
+    def wait_for_connection():
+        with pool.connection(timeout=5) as conn:
+            conn.execute("SELECT 1")
+    waiter = threading.Thread(target=wait_for_connection)
+    waiter.start()
+    time.sleep(0.3) # The third request waits for a connection
+    for conn in held:
+        pool.putconn(conn)
+    waiter.join(5)
+
+    manager.tune()
+    assert pool.max_size == 3 # +2, capped by max_ceiling
+    assert manager.stats()["resizes"] == 1
+
+    manager.tune() # No new requests: relax towards the configured size, never below it
+    assert pool.max_size == 2
+    manager.tune()
+    assert pool.max_size == 2
+    assert 1 <= pool.min_size <= pool.max_size
+    assert manager.stats()["resizes"] == 2
+
+
+def test_stats_report_pool_counters(make_pool):
+    pool = make_pool(1, 2)
+    manager = PoolManager(pool, keepalive_seconds=0)
+    for _ in range(3):
+        with pool.connection() as conn:
+            conn.execute("SELECT 1")
+    stats = manager.stats()
+    assert stats["requests_num"] >= 3
+    assert stats["pool_min"] == 1 and stats["pool_max"] == 2
+    assert stats["avg_usage_ms"] >= 0 and stats["avg_wait_ms"] >= 0
+    assert stats["healthy"] is None # No health check has run yet
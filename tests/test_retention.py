@@ -0,0 +1,75 @@
+import operator,uuid
+from typing import Annotated, TypedDict
+import pytest
+
+
+class State(TypedDict):
+    steps: Annotated[list, operator.add]
+
+
+def step(state:State) -> dict:
+    return {"steps": [len(state["steps"])]}
+
+
+@pytest.fixture
+def graph(db):
+    pytest.importorskip("langgraph.checkpoint.postgres")
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from langgraph.graph import StateGraph, START, END
+    checkpointer = PostgresSaver(db.get_pool())
+    checkpointer.setup()
+    builder = StateGraph(State).add_node("first", step).add_node("second", step)
+    builder.add_edge(START, "first").add_edge("first", "second").add_edge("second", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def checkpoint_count(db, thread_id:str) -> int:
+    with db.get_conn() as conn:
+        return conn.execute("SELECT count(*) AS n FROM checkpoints WHERE thread_id = %s", (thread_id,)).fetchone()['n']
+
+
+def test_keeps_the_latest_checkpoints_and_threads_resume(db, graph):
+    from retention import run_retention
+    threads = [str(uuid.uuid4()) for _ in range(3)]
+    try:
+        for thread_id in threads:
+            for _ in range(5):
+                graph.invoke({"steps": []}, {"configurable": {"thread_id": thread_id}})
+            assert checkpoint_count(db, thread_id) > 3
+        before = {t: graph.get_state({"configurable": {"thread_id": t}}).values for t in threads}
+
+        report = run_retention(keep=3, batch_size=2) # Small batches exercise the batching loop
+        assert not report["skipped"] and report["checkpoints"] >= 3 * len(threads)
+
+        for thread_id in threads:
+            config = {"configurable": {"thread_id": thread_id}}
+            assert checkpoint_count(db, thread_id) == 3
+            assert graph.get_state(config).values == before[thread_id]
+            # The next turn continues from the retained state
+            assert graph.invoke({"steps": []}, config)["steps"] == list(range(12))
+        with db.get_conn() as conn:
+            orphans = conn.execute("""
+                SELECT count(*) AS n FROM checkpoint_writes w WHERE w.thread_id = ANY(%s) AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns AND c.checkpoint_id = w.checkpoint_id
+                )
+            """, (threads,)).fetchone()['n']
+        assert orphans == 0
+    finally:
+        with db.get_conn() as conn:
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (threads,))
+
+
+def test_threads_under_the_limit_are_untouched(db, graph):
+    from retention import run_retention
+    thread_id = str(uuid.uuid4())
+    try:
+        graph.invoke({"steps": []}, {"configurable": {"thread_id": thread_id}})
+        count = checkpoint_count(db, thread_id)
+        run_retention(keep=count)
+        assert checkpoint_count(db, thread_id) == count
+    finally:
+        with db.get_conn() as conn:
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = %s", (thread_id,))
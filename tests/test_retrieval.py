@@ -0,0 +1,31 @@
+import numpy as np
+import retrieval
+from embedding_backends import StubEmbeddings
+
+
+class QueryEmbeddings(StubEmbeddings):
+    model_name = "stub"
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def embed_documents(self, texts):
+        raise AssertionError("queries must be embedded with embed_query")
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def test_embed_queries_embeds_original_text_under_normalised_keys(monkeypatch):
+    embeddings = QueryEmbeddings()
+    monkeypatch.setattr(retrieval, "get_embedding_model", lambda: embeddings)
+    monkeypatch.setattr(retrieval, "_QUERY_VECTORS", retrieval.vector_cache(1))
+    first = retrieval.embed_queries(["What is  RAG?", "what is rag?", "Other"])
+    assert embeddings.queries == ["What is  RAG?", "Other"]
+    assert first[0] == first[1]
+    assert np.allclose(first[0], StubEmbeddings().embed_query("What is  RAG?"), atol=1e-6)
+    assert retrieval.embed_queries(["WHAT IS RAG?"]) == [first[0]]
+    assert embeddings.queries == ["What is  RAG?", "Other"]
+    assert ("query", "stub", "what is rag?") in retrieval._QUERY_VECTORS._entries
@@ -0,0 +1,22 @@
+import time
+import pytest
+import database_utils
+
+
+def test_schema_check_is_throttled(monkeypatch):
+    # Within SCHEMA_CHECK_SECONDS of the last check nothing touches the database
+    monkeypatch.setattr(database_utils, "_schema_checked_at", time.monotonic())
+    monkeypatch.setattr(database_utils, "get_conn", lambda: pytest.fail("schema check should be skipped"))
+    assert database_utils.init_schema() is False
+
+
+def test_tables_come_back_after_a_reset(db, monkeypatch):
+    # What the nightly branch reset does to a running replica: every table is gone, the process keeps running
+    with db.get_conn() as conn:
+        conn.execute("DROP TABLE transcripts")
+        conn.execute("DROP TABLE schema_migrations")
+    monkeypatch.setattr(db, "SCHEMA_CHECK_SECONDS", 0)
+    assert db.init_schema() is True
+    with db.get_conn() as conn:
+        assert conn.execute("SELECT to_regclass('transcripts') IS NOT NULL AS present").fetchone()['present']
+    assert db.init_schema() is False
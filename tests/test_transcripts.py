@@ -0,0 +1,57 @@
+import threading,time
+import transcripts
+from RAG import get_chunk_size
+from transcripts import chunk_snippets
+
+
+def snippets(count:int) -> list[dict]:
+    return [{"text": f"snippet number {i} says something", "start": i * 2.0, "duration": 2.0} for i in range(count)]
+
+
+def test_chunks_are_sized_and_overlap():
+    size = get_chunk_size("YTvideo")
+    chunks = list(chunk_snippets(snippets(100), "Some video", "abc"))
+    assert len(chunks) > 1
+    for chunk in chunks[:-1]:
+        assert size["chunk_size"] <= len(chunk.page_content) < size["chunk_size"] + 40
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.metadata["start"] < previous.metadata["end"] # Carried over snippets
+        carried = current.page_content.split(" snippet number")[0]
+        assert carried.startswith("snippet number") and carried in previous.page_content
+
+
+def test_chunk_metadata_and_timestamps():
+    chunks = list(chunk_snippets(snippets(100), "Some video", "abc"))
+    first, last = chunks[0], chunks[-1]
+    assert first.metadata["video_id"] == "abc" and first.metadata["source"] == "Some video"
+    assert first.metadata["start"] == 0.0
+    assert first.metadata["timestamp"] == f"0:00-0:{first.metadata['end']:02.0f}"
+    assert last.metadata["end"] == 200.0
+    assert last.page_content.endswith("snippet number 99 says something")
+
+
+def test_skips_blank_snippets_and_short_videos():
+    items = [{"text": "  ", "start": 0.0, "duration": 1.0}, {"text": "only words", "start": 1.0, "duration": 1.5}]
+    chunks = list(chunk_snippets(items, "Short", "xyz"))
+    assert [c.page_content for c in chunks] == ["only words"]
+    assert chunks[0].metadata["start"] == 1.0 and chunks[0].metadata["end"] == 2.5
+    assert list(chunk_snippets([], "Empty", "e")) == []
+
+
+def test_video_locks_serialise_and_are_released():
+    active, overlaps = [], []
+
+    def index(video_id):
+        with transcripts._video_lock(video_id):
+            overlaps.append(video_id in active)
+            active.append(video_id)
+            time.sleep(0.02)
+            active.remove(video_id)
+
+    threads = [threading.Thread(target=index, args=(f"video{i % 3}",)) for i in range(9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [False] * 9
+    assert transcripts._VIDEO_LOCKS == {}